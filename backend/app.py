@@ -1,6 +1,8 @@
-from fastapi import FastAPI, HTTPException, status # Added status for clarity
-from pymongo import AsyncMongoClient, MongoClient
-from typing import Any, List, Dict, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, status # Added status for clarity
+from fastapi.responses import StreamingResponse
+from pymongo import AsyncMongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from typing import Any, Awaitable, Callable, List, Dict, NamedTuple, Optional, Tuple
 from loguru import logger
 import os
 from dotenv import load_dotenv
@@ -9,8 +11,28 @@ from wom import Metric
 import asyncio
 from contextlib import asynccontextmanager
 from cachetools import LRUCache
-import pandas as pd
 import io
+import csv
+import heapq
+import operator
+import time
+import gzip
+import hashlib
+import msgspec
+import re
+import bisect
+import functools
+import datetime
+import collections
+import itertools
+import socket
+import hmac
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 load_dotenv()
@@ -19,40 +41,355 @@ MONGO_URI = os.getenv("MONGO_URI")
 DATABASE_NAME = "Frenzy"
 COLLECTION_NAME_1 = "ironfoundry"
 COLLECTION_NAME_2 = "ironclad"
-COLLECTION_NAME_3 = "Templates"
-ACTUAL_HEADERS = ["Rank", "Username", "Team", "Start", "End", "Gained", "Last Updated"]
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "50"))
+
+WOM_API_BASE_URL = os.getenv("WOM_API_BASE_URL") # Point at a local fake WOM server for testing
+WOM_COMPETITION_ID = int(os.getenv("WOM_COMPETITION_ID", "90513"))
+WOM_MAX_CONCURRENCY = int(os.getenv("WOM_MAX_CONCURRENCY", "4"))
+# WOM allows 100 requests/minute with an API key and 20 without one.
+WOM_RATE_LIMIT = int(os.getenv("WOM_RATE_LIMIT", "100" if os.getenv("WOM_API") else "20"))
+WOM_RATE_PERIOD_SECONDS = float(os.getenv("WOM_RATE_PERIOD_SECONDS", "60"))
+WOM_RATE_BURST = int(os.getenv("WOM_RATE_BURST", "13"))
+# Keep only the top N rows of each WOM board (0 keeps every row).
+WOM_BOARD_MAX_ROWS = int(os.getenv("WOM_BOARD_MAX_ROWS", "0"))
+# Per-team standings are computed from every WOM CSV the refresh fetches. Extra
+# metrics listed here are fetched for /standings only and get no board.
+WOM_STANDINGS_TOP = int(os.getenv("WOM_STANDINGS_TOP", "5"))
+WOM_STANDINGS_METRICS = [metric.strip() for metric in os.getenv("WOM_STANDINGS_METRICS", "").split(",") if metric.strip()]
+# Template documents carry a "version" counter bumped by every writer. Cached
+# copies re-check it at most every TEMPLATE_VERSION_CHECK_SECONDS and are
+# reloaded unconditionally after TEMPLATE_CACHE_MAX_AGE_SECONDS.
+TEMPLATE_VERSION_CHECK_SECONDS = float(os.getenv("TEMPLATE_VERSION_CHECK_SECONDS", "2"))
+TEMPLATE_CACHE_MAX_AGE_SECONDS = float(os.getenv("TEMPLATE_CACHE_MAX_AGE_SECONDS", "60"))
+TEMPLATE_DELTA_HISTORY = int(os.getenv("TEMPLATE_DELTA_HISTORY", "200"))
+# Live standings: frames kept for reconnecting clients, SSE keepalive interval,
+# and how many row changes a board may push before clients are told to refetch it.
+LIVE_BUFFER_SIZE = max(1, int(os.getenv("LIVE_BUFFER_SIZE", "512"))) # Streams read the oldest buffered frame
+LIVE_KEEPALIVE_SECONDS = float(os.getenv("LIVE_KEEPALIVE_SECONDS", "15"))
+LIVE_MAX_CHANGES_PER_BOARD = int(os.getenv("LIVE_MAX_CHANGES_PER_BOARD", "100"))
+WOM_REFRESH_SECONDS = float(os.getenv("WOM_REFRESH_SECONDS", "300"))
+MONGO_REFRESH_SECONDS = float(os.getenv("MONGO_REFRESH_SECONDS", "300"))
+REFRESH_RETRY_SECONDS = float(os.getenv("REFRESH_RETRY_SECONDS", "30"))
+REFRESH_MAX_BACKOFF_SECONDS = float(os.getenv("REFRESH_MAX_BACKOFF_SECONDS", "1800"))
+# Every refresh appends a delta-encoded snapshot per changed board, with a full
+# keyframe every HISTORY_KEYFRAME_EVERY snapshots. "off" disables history.
+LEADERBOARD_HISTORY = os.getenv("LEADERBOARD_HISTORY", "on")
+HISTORY_KEYFRAME_EVERY = int(os.getenv("HISTORY_KEYFRAME_EVERY", "48"))
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "500"))
+# "mongo" lets one worker hold a lease in Mongo, refresh, and publish the encoded
+# cache for the other workers to follow; "local" has every worker refresh itself.
+REFRESH_COORDINATION = os.getenv("REFRESH_COORDINATION", "local")
+REFRESH_LEASE_SECONDS = float(os.getenv("REFRESH_LEASE_SECONDS", "30"))
+REFRESH_FOLLOW_SECONDS = float(os.getenv("REFRESH_FOLLOW_SECONDS", "5"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Bearer token for the admin endpoints; they are disabled while it is unset.
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+# Written atomically after each refresh and loaded at startup; empty disables it.
+LEADERBOARD_SNAPSHOT_PATH = os.getenv("LEADERBOARD_SNAPSHOT_PATH", "leaderboard_snapshot.json.gz")
+LEADERBOARD_SNAPSHOT_FORMAT = 2 # Columnar boards
+# Per-source interval overrides, e.g. "overall=120,mongo=60"
+REFRESH_INTERVAL_OVERRIDES = {
+    name.strip(): float(seconds)
+    for name, seconds in (pair.split("=") for pair in os.getenv("REFRESH_INTERVAL_OVERRIDES", "").split(",") if pair.strip())
+}
+WOM_METRICS = [Metric.Overall.value, 
+               Metric.Ehb.value, 
+               Metric.Ehp.value, 
+               Metric.ClueScrollsAll.value, 
+               Metric.TombsOfAmascutExpert.value, 
+               Metric.ChambersOfXeric.value, 
+               Metric.TheatreOfBlood.value, 
+               Metric.TheCorruptedGauntlet.value,
+               Metric.Slayer.value,
+               Metric.BarrowsChests.value,
+               Metric.GiantMole.value,
+               Metric.Yama.value,
+               Metric.CollectionsLogged.value
+               ]
 
-leaderboards_cache = LRUCache(maxsize=1)
-client = MongoClient(MONGO_URI, maxPoolSize=None, maxIdleTimeMS=60000 * 5, maxConnecting=10)
+leaderboards_cache = LRUCache(maxsize=16)
+# Encoded /leaderboards/{board} slices that don't line up with the precomputed pages,
+# keyed by (board, board etag, offset, limit, format, coding).
+leaderboard_slice_cache = LRUCache(maxsize=int(os.getenv("LEADERBOARD_SLICE_CACHE_SIZE", "256")))
 async_client = AsyncMongoClient(MONGO_URI, maxPoolSize=None, maxIdleTimeMS=60000 * 5, maxConnecting=10)
-db = client[DATABASE_NAME]
-if_coll = db[COLLECTION_NAME_1]
-ic_coll = db[COLLECTION_NAME_2]
-players = db["Players"]
 async_db = async_client[DATABASE_NAME]
 if_coll_async = async_db[COLLECTION_NAME_1]
 ic_coll_async = async_db[COLLECTION_NAME_2]
 players_coll_async = async_db["Players"]
+history_snapshots_coll_async = async_db["LeaderboardSnapshots"]
+history_series_coll_async = async_db["LeaderboardHistory"]
+refresh_lease_coll_async = async_db["RefreshLease"]
+shared_cache_coll_async = async_db["LeaderboardCache"]
+template_colls_async = {"ironfoundry": if_coll_async, "ironclad": ic_coll_async}
 foundry_link = "https://imgur.com/eVNvP9K.png"
 clad_link = "https://i.imgur.com/a0DB45h.png"
+# Boards are stored as parallel rsn/value/clan columns. The clan column indexes
+# these tables, and icon and profile links are derived from them when needed.
+LEADERBOARD_CLANS = [None, "ironfoundry", "ironclad"]
+LEADERBOARD_CLAN_ICONS = ["", foundry_link, clad_link]
+CLAN_INDEXES = {clan: i for i, clan in enumerate(LEADERBOARD_CLANS)}
+PROFILE_BASE_URL = "https://wiseoldman.net/players/"
+COLUMNAR_TABLES = {"clans": LEADERBOARD_CLANS, "icons": LEADERBOARD_CLAN_ICONS, "profile_base_url": PROFILE_BASE_URL}
+
+
+CONTENT_CODINGS = ("br", "gzip")
+
+
+def _encode_payload(payload: Any, encodings: tuple = CONTENT_CODINGS) -> Dict[str, Any]:
+    """
+    Serializes a payload once into JSON bytes, pre-compresses it and tags it
+    with a content-hash ETag so endpoints can serve it without re-encoding.
+    Codings left out of encodings are None and never negotiated.
+    """
+    body = msgspec.json.encode(payload, enc_hook=str) # ObjectId and other BSON types encode as strings
+    return {
+        "etag": f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=6) if "gzip" in encodings else None,
+        "br": brotli.compress(body, quality=5) if brotli and "br" in encodings else None,
+    }
+
+
+def _representation_etag(etag: str, encoding: Optional[str]) -> str:
+    """Each content-coding of a payload gets its own strong validator: '"<hash>-gzip"'."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def _payload_etag(tag: str) -> str:
+    """The payload ETag an If-None-Match entry refers to, whichever coding it was served in."""
+    tag = tag.strip().removeprefix("W/")
+    for encoding in CONTENT_CODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return f'{tag[:-len(suffix)]}"'
+    return tag
+
+
+def _negotiate_encoding(request: Request, encoded: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """The preferred coding the client accepts and, if given, encoded carries."""
+    accepted_encodings = {part.split(";")[0].strip() for part in request.headers.get("accept-encoding", "").split(",")}
+    for encoding in CONTENT_CODINGS:
+        if encoding in accepted_encodings and (encoded is None or encoded.get(encoding) is not None):
+            if encoding != "br" or brotli:
+                return encoding
+    return None
 
 
-async def refresh_leaderboards_cache(app: FastAPI):
-    REFRESH_INTERVAL_SECONDS = 5 * 60 # 5 minutes
+def _encoded_response(request: Request, encoded: Dict[str, Any]) -> Response:
+    encoding = _negotiate_encoding(request, encoded)
+    headers = {"ETag": _representation_etag(encoded["etag"], encoding), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
 
-    while True:
-        logger.info(f"Background task: Attempting to refresh leaderboard data.")
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        client_etags = {_payload_etag(tag) for tag in if_none_match.split(",")}
+        if "*" in client_etags or encoded["etag"] in client_etags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(content=encoded[encoding], media_type="application/json", headers=headers)
+    return Response(content=encoded["identity"], media_type="application/json", headers=headers)
+
+
+def _board_slug(title: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", title.lower()).strip("_")
+
+
+class LeaderboardRow(msgspec.Struct):
+    """A row-format entry; only built while encoding, boards themselves are columnar."""
+    index: int
+    rsn: str
+    value: Any
+    profile_link: str
+    icon_link: str
+
+
+def _board_rows(board: Dict, start: int = 0, end: Optional[int] = None) -> List[LeaderboardRow]:
+    return [
+        LeaderboardRow(index, rsn, value, f"{PROFILE_BASE_URL}{str(rsn).replace(' ', '%20')}", LEADERBOARD_CLAN_ICONS[clan])
+        for index, rsn, value, clan in zip(
+            itertools.count(start + 1), board["rsn"][start:end], board["value"][start:end], board["clan"][start:end]
+        )
+    ]
+
+
+def _same_board_rows(board: Dict, other: Dict) -> bool:
+    return board["rsn"] == other["rsn"] and board["value"] == other["value"] and board["clan"] == other["clan"]
+
+
+def _board_page(board: Dict, offset: int, limit: int, columnar: bool = False) -> Dict:
+    page = {
+        "board": board["board"],
+        "title": board["title"],
+        "metric_page": board["metric_page"],
+        "total": len(board["rsn"]),
+        "offset": offset,
+        "limit": limit,
+    }
+    if columnar:
+        end = offset + limit
+        page.update(COLUMNAR_TABLES, rsn=board["rsn"][offset:end], value=board["value"][offset:end], clan=board["clan"][offset:end])
+    else:
+        page["data"] = _board_rows(board, offset, offset + limit)
+    return page
+
+
+def _build_board_slices(combined_data: List[Dict], previous_boards: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+    """
+    Splits every board into pre-encoded LEADERBOARD_PAGE_SIZE pages keyed by
+    board slug, and pre-encodes it whole in both wire formats. Boards whose
+    columns did not change are reused as they are.
+    """
+    boards: Dict[str, Dict] = {}
+    for leaderboard in combined_data:
+        slug = _board_slug(leaderboard["title"])
+        previous = (previous_boards or {}).get(slug)
+        if previous is not None and _same_board_rows(previous, leaderboard):
+            boards[slug] = previous
+            continue
+
+        board = {**leaderboard, "board": slug}
+        board["pages"] = [
+            _encode_payload(_board_page(board, offset, LEADERBOARD_PAGE_SIZE))
+            for offset in range(0, max(len(board["rsn"]), 1), LEADERBOARD_PAGE_SIZE)
+        ]
+        # Spliced into the combined payloads, so an unchanged board is never re-encoded.
+        board["encoded_rows"] = msgspec.Raw(msgspec.json.encode(
+            {"title": board["title"], "metric_page": board["metric_page"], "data": _board_rows(board)}, enc_hook=str
+        ))
+        board["encoded_columns"] = msgspec.Raw(msgspec.json.encode(
+            {key: board[key] for key in ("board", "title", "metric_page", "rsn", "value", "clan")}, enc_hook=str
+        ))
+        board["etag"] = hashlib.blake2b(bytes(board["encoded_columns"]), digest_size=16).hexdigest()
+        # Rank index: positions by normalized rsn, and ascending negated values
+        # so a value's tie-aware rank is one bisect away.
+        board["positions"] = {_normalize_rsn(rsn): position for position, rsn in enumerate(board["rsn"])}
+        board["rank_values"] = sorted(-value for value in board["value"])
+        boards[board["board"]] = board
+    return boards
+
+
+def _normalize_rsn(rsn: Any) -> str:
+    # OSRS treats spaces, underscores and hyphens in names as the same character.
+    return re.sub(r"[\s_-]+", " ", str(rsn)).strip().lower()
+
+
+def _board_rank(board: Dict, value: Any) -> int:
+    """Competition rank of value on board: one more than the number of strictly greater values."""
+    return bisect.bisect_left(board["rank_values"], -value) + 1
+
+
+class LiveBroadcaster:
+    """
+    One ring buffer of pre-encoded server-sent-event frames shared by every
+    /live client, so a change is serialized once however many are watching.
+    """
+
+    def __init__(self, size: int):
+        self.frames: collections.deque = collections.deque(maxlen=size) # (seq, frame bytes)
+        self.seq = 0
+        self.listeners = 0
+        self._wake = asyncio.Event()
+
+    def publish(self, event: str, payload: Any):
+        self.seq += 1
+        data = msgspec.json.encode(payload, enc_hook=str)
+        self.frames.append((self.seq, b"id: %d\nevent: %s\ndata: %s\n\n" % (self.seq, event.encode(), data)))
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+    def _resync_frame(self) -> bytes:
+        return b"id: %d\nevent: resync\ndata: {}\n\n" % self.seq
+
+    async def stream(self, last_seq: Optional[int]):
+        self.listeners += 1
         try:
-            combined_data = await _get_all_leaderboards_data()
-            combined_leaderboards_dict = {"Data": combined_data}
-            
-            leaderboards_cache['combined_leaderboards'] = combined_leaderboards_dict
-            logger.info(f"Background task: Leaderboard data updated in cache.")
+            if last_seq is None:
+                last_seq = self.seq
+            elif last_seq > self.seq:
+                # Id from before a restart; the client has to reload.
+                yield self._resync_frame()
+                last_seq = self.seq
+
+            while True:
+                if last_seq == self.seq:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), LIVE_KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+                    continue
+
+                first_seq = self.frames[0][0]
+                if last_seq < first_seq - 1:
+                    # Fell behind the buffer; missed changes cannot be replayed.
+                    yield self._resync_frame()
+                    last_seq = self.seq
+                    continue
 
+                for last_seq, frame in list(itertools.islice(self.frames, last_seq - first_seq + 1, None)):
+                    yield frame
+        finally:
+            self.listeners -= 1
+
+
+live_broadcaster = LiveBroadcaster(LIVE_BUFFER_SIZE)
+
+
+def _publish_leaderboard_changes(previous_boards: Dict[str, Dict], boards: Dict[str, Dict]):
+    """Pushes rank and points changes per board, or a reload hint when a board changed too much."""
+    for slug, board in boards.items():
+        previous = previous_boards.get(slug)
+        if previous is None or _same_board_rows(previous, board):
+            continue
+
+        previous_positions = {rsn: position for position, rsn in enumerate(previous["rsn"])}
+        changes = []
+        for position, (rsn, value) in enumerate(zip(board["rsn"], board["value"])):
+            old_position = previous_positions.get(rsn)
+            if old_position is None or old_position != position or previous["value"][old_position] != value:
+                changes.append({
+                    "rsn": rsn,
+                    "rank": position + 1,
+                    "previous_rank": old_position + 1 if old_position is not None else None,
+                    "value": value,
+                    "previous_value": previous["value"][old_position] if old_position is not None else None,
+                })
+                if len(changes) > LIVE_MAX_CHANGES_PER_BOARD:
+                    break
+        removed = len(previous_positions) + sum(1 for change in changes if change["previous_rank"] is None) - len(board["rsn"])
+
+        if len(changes) > LIVE_MAX_CHANGES_PER_BOARD or removed > 0:
+            live_broadcaster.publish("leaderboard", {"board": slug, "title": board["title"], "reload": True})
+        elif changes:
+            live_broadcaster.publish("leaderboard", {"board": slug, "title": board["title"], "changes": changes})
+
+
+def _set_leaderboards_cache(combined_data: List[Dict]):
+    boards = _build_board_slices(combined_data, leaderboards_cache.get('leaderboard_boards'))
+    leaderboards_cache['leaderboard_boards'] = boards
+    leaderboards_cache['combined_leaderboards_encoded'] = _encode_payload({"Data": [
+        board["encoded_rows"] for board in boards.values()
+    ]})
+    leaderboards_cache['combined_leaderboards_columnar_encoded'] = _encode_payload({
+        "format": "columnar",
+        **COLUMNAR_TABLES,
+        "Data": [board["encoded_columns"] for board in boards.values()],
+    })
+    leaderboards_cache['leaderboard_index_encoded'] = _encode_payload({"Data": [
+        {"board": slug, "title": board["title"], "metric_page": board["metric_page"], "count": len(board["rsn"])}
+        for slug, board in boards.items()
+    ]})
+
+
+async def refresh_leaderboards_cache(app: FastAPI):
+    while True:
+        try:
+            await _refresh_due_leaderboard_sources()
         except Exception as e:
             logger.error(f"Background task: Failed to refresh leaderboard data: {e}", exc_info=True)
 
-        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+        next_refresh_at = min(source["next_refresh_at"] for source in leaderboard_sources.values())
+        await asyncio.sleep(max(1.0, next_refresh_at - time.monotonic()))
 
 
 
@@ -60,17 +397,27 @@ async def refresh_leaderboards_cache(app: FastAPI):
 async def lifespan(app: FastAPI):
     logger.info("FastAPI application startup initiated.")
     try:
-        app.state.wom_client = wom.Client(api_key=os.getenv("WOM_API"), user_agent="@saltis.")
+        app.state.wom_client = wom.Client(api_key=os.getenv("WOM_API"), user_agent="@saltis.", api_base_url=WOM_API_BASE_URL)
         await app.state.wom_client.start()
         logger.info("WOM Client started successfully via Lifespan.")
+
+        if _load_leaderboard_snapshot():
+            logger.info("Serving leaderboards from the warm-start snapshot until the next refresh.")
         
-        app.state.background_refresh_task = asyncio.create_task(refresh_leaderboards_cache(app))
-        logger.info("Background leaderboard refresh task started.")
+        if REFRESH_COORDINATION == "mongo":
+            app.state.refresh_coordinator_task = asyncio.create_task(_coordinate_refresh(app))
+            logger.info(f"Refresh coordinator started for worker {WORKER_ID}.")
+        else:
+            # The loop's first pass is the initial population; every source starts due.
+            app.state.background_refresh_task = asyncio.create_task(refresh_leaderboards_cache(app))
+            logger.info("Background leaderboard refresh task started.")
 
-        app.state.initial_cache_populate_task = asyncio.create_task(
-            _perform_initial_cache_population(app)
-        )
-        logger.info("Initial cache population task started in background.")
+            if MONGO_LEADERBOARD_SYNC != "off":
+                app.state.mongo_sync_task = asyncio.create_task(_sync_mongo_leaderboards())
+                logger.info(f"MongoDB leaderboard sync task started (mode={MONGO_LEADERBOARD_SYNC}).")
+
+        app.state.live_template_task = asyncio.create_task(_watch_templates_live())
+        logger.info("Live template watch task started.")
 
     except RuntimeError as e:
         logger.warning(f"WOM Client already started or encountered an issue during lifespan startup: {e}")
@@ -92,13 +439,29 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             logger.info("Background refresh task successfully cancelled.")
     
-    if hasattr(app.state, 'initial_cache_populate_task') and not app.state.initial_cache_populate_task.done():
-        app.state.initial_cache_populate_task.cancel()
-        logger.info("Initial cache population task cancelled.")
+    if hasattr(app.state, 'mongo_sync_task') and not app.state.mongo_sync_task.done():
+        app.state.mongo_sync_task.cancel()
+        logger.info("MongoDB leaderboard sync task cancelled.")
+        try:
+            await app.state.mongo_sync_task
+        except asyncio.CancelledError:
+            logger.info("MongoDB leaderboard sync task successfully cancelled.")
+
+    if hasattr(app.state, 'refresh_coordinator_task') and not app.state.refresh_coordinator_task.done():
+        app.state.refresh_coordinator_task.cancel()
+        logger.info("Refresh coordinator cancelled.")
         try:
-            await app.state.initial_cache_populate_task
+            await app.state.refresh_coordinator_task
         except asyncio.CancelledError:
-            logger.info("Initial cache population task successfully cancelled.")
+            logger.info("Refresh coordinator successfully cancelled.")
+
+    if hasattr(app.state, 'live_template_task') and not app.state.live_template_task.done():
+        app.state.live_template_task.cancel()
+        logger.info("Live template watch task cancelled.")
+        try:
+            await app.state.live_template_task
+        except asyncio.CancelledError:
+            logger.info("Live template watch task successfully cancelled.")
 
     if hasattr(app.state, 'wom_client') and app.state.wom_client:
         try:
@@ -106,340 +469,1250 @@ async def lifespan(app: FastAPI):
             logger.info("WOM Client closed successfully via Lifespan.")
         except Exception as e:
             logger.error(f"Failed to close WOM Client during lifespan shutdown: {e}")
-    
-    if hasattr(app.state, 'initial_cache_populate_task') and not app.state.initial_cache_populate_task.done():
-        app.state.initial_cache_populate_task.cancel()
-        logger.info("Initial cache population task cancelled.")
-        try:
-            await app.state.initial_cache_populate_task
-        except asyncio.CancelledError:
-            logger.info("Initial cache population task successfully cancelled.")
-            
 
-async def _perform_initial_cache_population(app: FastAPI):
-    logger.info("Initial cache population: Starting data fetch.")
-    try:
-        combined_data = await _get_all_leaderboards_data()
-        leaderboards_cache['combined_leaderboards'] = {"Data": combined_data}
-        logger.info("Initial leaderboard cache populated successfully.")
-    except Exception as e:
-        logger.error(f"Failed to perform initial leaderboard cache population: {e}", exc_info=True)
 
 
+async def _acquire_refresh_lease() -> Optional[List[str]]:
+    """
+    Takes or renews the refresh lease; expiry is judged by the server clock so
+    worker clocks may drift. Returns None when another worker holds it, else
+    the sources other workers asked to refresh since the last renewal.
+    """
+    try:
+        previous = await refresh_lease_coll_async.find_one_and_update(
+            {"_id": "leaderboards", "$or": [{"holder": WORKER_ID}, {"$expr": {"$lt": ["$expires_at", "$$NOW"]}}]},
+            [{"$set": {
+                "holder": WORKER_ID,
+                "expires_at": {"$add": ["$$NOW", int(REFRESH_LEASE_SECONDS * 1000)]},
+                "requested": [],
+            }}],
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        return None # Held by another worker
+    return (previous or {}).get("requested", [])
 
-app = FastAPI(lifespan=lifespan)
 
-async def _get_total_gained_leaderboard_helper() -> List[Dict]:
-    logger.info("Fetching Total Gained leaderboard data from MongoDB.")
-    leaderboard_entries: List[Dict] = []
-    try:
-        cursor = players_coll_async.find({}).sort("total_gained", -1)
-        player_docs = await cursor.to_list(length=None)
+async def _request_leader_refresh(source_name: str):
+    await refresh_lease_coll_async.update_one({"_id": "leaderboards"}, {"$addToSet": {"requested": source_name}})
 
-        rows: List[Dict] = []
-        for i, doc in enumerate(player_docs):
-            rsn = doc.get("rsn")
-            value = doc.get("total_gained")
-            
-            clan = doc.get("clan")
-            if not isinstance(rsn, str) or not isinstance(value, (int, float)):
-                logger.warning(f"Skipping Total Gained entry due to non-standard RSN/Value type for doc: {doc.get('_id')}")
-                continue
 
-            profile_link = f"https://wiseoldman.net/players/{str(rsn).replace(' ', '%20')}"
-            
-            icon_link = ""
-            if clan == "ironfoundry":
-                icon_link = foundry_link
-            elif clan == "ironclad":
-                icon_link = clad_link
-
-            rows.append({
-                "index": i + 1,
-                "rsn": rsn,
-                "value": value,
-                "profile_link": profile_link,
-                "icon_link": icon_link,
-            })
-        
-        if rows:
-            leaderboard_entries.append({
-                "title": "Total Gained (Points)",
-                "metric_page": None,
-                "data": rows
-            })
-        return leaderboard_entries
-    except Exception as e:
-        logger.error(f"Error fetching Total Gained leaderboard from MongoDB: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch Total Gained leaderboard: {e}")
-
-async def _get_wom_leaderboards_data_helper() -> List[Dict]:
-    CSV_COLUMN_USERNAME = 'Username'
-    CSV_COLUMN_TEAM = 'Team'
-    CSV_COLUMN_GAINED = 'Gained'
-    logger.info("Fetching Wiseoldman competition CSV data using wom_client and parsing with pandas.")
-    competition_id = 90513
-    
-    metrics = [Metric.Overall.value, 
-               Metric.Ehb.value, 
-               Metric.Ehp.value, 
-               Metric.ClueScrollsAll.value, 
-               Metric.TombsOfAmascutExpert.value, 
-               Metric.ChambersOfXeric.value, 
-               Metric.TheatreOfBlood.value, 
-               Metric.TheCorruptedGauntlet.value,
-               Metric.Slayer.value,
-               Metric.BarrowsChests.value,
-               Metric.GiantMole.value,
-               Metric.Yama.value,
-               Metric.CollectionsLogged.value
-               ]
+async def _release_refresh_lease():
+    await refresh_lease_coll_async.delete_one({"_id": "leaderboards", "holder": WORKER_ID})
 
 
-    wom_leaderboards: List[Dict] = []
+# Shared store document id -> cache entry the leader publishes under it.
+SHARED_CACHE_KEYS = {
+    "leaderboards": 'combined_leaderboards_columnar_encoded',
+    "standings": 'standings_encoded',
+}
 
+
+async def _publish_shared_leaderboards():
+    """Leader side: stores each encoded cache entry whenever its ETag changes."""
+    published_etags: Dict[str, str] = {}
+    while True:
+        for doc_id, cache_key in SHARED_CACHE_KEYS.items():
+            encoded = leaderboards_cache.get(cache_key)
+            if encoded is None or encoded["etag"] == published_etags.get(doc_id):
+                continue
+            try:
+                await shared_cache_coll_async.replace_one(
+                    {"_id": doc_id},
+                    {"_id": doc_id, "etag": encoded["etag"], "gzip": encoded["gzip"], "holder": WORKER_ID, "updated_at": datetime.datetime.now(datetime.timezone.utc)},
+                    upsert=True,
+                )
+                published_etags[doc_id] = encoded["etag"]
+                logger.info(f"Published {doc_id} cache {encoded['etag']} to the shared store ({len(encoded['gzip'])} bytes).")
+            except Exception as e:
+                logger.error(f"Publishing {doc_id} cache to the shared store failed: {e}")
+        await asyncio.sleep(REFRESH_FOLLOW_SECONDS)
+
+
+async def _follow_shared_leaderboards():
+    """Follower side: loads each of the leader's cache entries when its ETag differs from ours."""
+    for doc_id, cache_key in SHARED_CACHE_KEYS.items():
+        encoded = leaderboards_cache.get(cache_key)
+        doc = await shared_cache_coll_async.find_one(
+            {"_id": doc_id, "etag": {"$ne": encoded["etag"] if encoded else None}}
+        )
+        if doc is None:
+            continue
+        payload = msgspec.json.decode(gzip.decompress(doc["gzip"]))
+        if doc_id == "leaderboards":
+            _apply_leaderboards([
+                {key: board[key] for key in ("title", "metric_page", "rsn", "value", "clan")}
+                for board in payload["Data"]
+            ])
+        else:
+            wom_standings.update((standing["metric"], standing) for standing in payload["Data"])
+            _set_standings_cache()
+        logger.info(f"Loaded {doc_id} cache {doc['etag']} published by {doc['holder']}.")
+
+
+def _start_refresh_tasks(app: FastAPI) -> List[asyncio.Task]:
+    tasks = [
+        asyncio.create_task(refresh_leaderboards_cache(app)),
+        asyncio.create_task(_publish_shared_leaderboards()),
+    ]
+    if MONGO_LEADERBOARD_SYNC != "off":
+        tasks.append(asyncio.create_task(_sync_mongo_leaderboards()))
+    return tasks
+
+
+async def _stop_tasks(tasks: List[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _coordinate_refresh(app: FastAPI):
+    """
+    Runs the refresh tasks only while this worker holds the lease; otherwise
+    follows the cache the leader publishes, so workers do not multiply WOM
+    and Mongo load.
+    """
+    refresh_tasks: List[asyncio.Task] = []
+    requested_refreshes: List[asyncio.Task] = [] # Refreshes other workers asked for, stopped with the refresh tasks
+    app.state.refresh_leader = False
     try:
-        current_wom_client: wom.Client = app.state.wom_client
-        for metric in metrics:
-            logger.info(f"Fetching data for metric: {metric} from WOM CSV endpoint.")
-            
-            response: wom.Result = await current_wom_client.competitions.get_details_csv(
-                id=competition_id, metric=metric # type: ignore
-            )
-
-            if response.is_ok:
-                csv_content: str = response.unwrap()
-                df = pd.read_csv(io.StringIO(csv_content))
-                
-                if df.empty:
-                    logger.warning(f"CSV data for metric {metric} is empty. Skipping leaderboard generation.")
-                    continue
-                    
-                df[CSV_COLUMN_GAINED] = pd.to_numeric(df[CSV_COLUMN_GAINED], errors='coerce').fillna(0).astype(float)
-                
-                logger.info(f"Successfully parsed {len(df)} rows for {metric} from WOM CSV using pandas.")
-
-                leaderboard_title = f"{metric.replace('_', ' ').title()}"
-                
-                leaderboard_rows = []
-                sorted_df = df.sort_values(by=CSV_COLUMN_GAINED, ascending=False)
-
-                for i, row in enumerate(sorted_df.itertuples(index=False)): 
-                    rsn = getattr(row, CSV_COLUMN_USERNAME, 'N/A')
-                    value = getattr(row, CSV_COLUMN_GAINED, 0.0)
-                    team_name = getattr(row, CSV_COLUMN_TEAM, None)
-                    
-                    profile_username_encoded = str(rsn).replace(' ', '%20')
-                    profile_link = f"https://wiseoldman.net/players/{profile_username_encoded}"
-                    
-                    player_icon_link = ""
-                    if team_name == "Iron Foundry":
-                        player_icon_link = foundry_link
-                    elif team_name == "Ironclad":
-                        player_icon_link = clad_link
-
-                    leaderboard_rows.append({
-                        "index": i + 1,
-                        "rsn": rsn,
-                        "value": value,
-                        "profile_link": profile_link,
-                        "icon_link": player_icon_link
-                    })
-                
-                competition_page_url = f"https://wiseoldman.net/competitions/{competition_id}?preview={metric.lower().replace(" ", "_")}"
-                
-                wom_leaderboards.append({
-                    "title": leaderboard_title,
-                    "metric_page": competition_page_url,
-                    "data": leaderboard_rows
-                })
-            else:
-                logger.error(f"Failed to fetch {metric} competition details from WOM CSV (is_ok=False): {response.error_message}")
-            
-            await asyncio.sleep(5) 
+        while True:
+            try:
+                requested = await _acquire_refresh_lease()
+            except Exception as e:
+                logger.error(f"Refresh lease check failed: {e}")
+                requested = None
+            is_leader = requested is not None
+
+            if is_leader and not refresh_tasks:
+                logger.info(f"Worker {WORKER_ID} took the refresh lease; starting refresh tasks.")
+                refresh_tasks = _start_refresh_tasks(app)
+            elif not is_leader and refresh_tasks:
+                logger.warning(f"Worker {WORKER_ID} lost the refresh lease; following the shared cache.")
+                await _stop_tasks(refresh_tasks + requested_refreshes)
+                refresh_tasks, requested_refreshes = [], []
+            app.state.refresh_leader = is_leader
+
+            requested_sources = [leaderboard_sources[name] for name in requested or [] if name in leaderboard_sources]
+            if requested_sources:
+                logger.info(f"Refreshing sources requested through the lease: {', '.join(requested or [])}.")
+                requested_refreshes.append(asyncio.create_task(_refresh_leaderboard_sources(requested_sources)))
+            for task in [task for task in requested_refreshes if task.done()]:
+                requested_refreshes.remove(task)
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error(f"Requested leaderboard refresh failed: {task.exception()}")
+
+            if not is_leader:
+                try:
+                    await _follow_shared_leaderboards()
+                except Exception as e:
+                    logger.error(f"Following the shared leaderboard cache failed: {e}")
+
+            await asyncio.sleep(min(REFRESH_LEASE_SECONDS / 3, REFRESH_FOLLOW_SECONDS))
+    finally:
+        await _stop_tasks(refresh_tasks + requested_refreshes)
+        if app.state.refresh_leader:
+            try:
+                await _release_refresh_lease()
+            except Exception as e:
+                logger.error(f"Releasing the refresh lease failed: {e}")
 
-        return wom_leaderboards
 
-    except Exception as e:
-        logger.error(f"An unexpected error occurred in _get_wom_leaderboards_data_helper (CSV): {e}", exc_info=True)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to generate leaderboard data from Wiseoldman CSV: {e}"
+app = FastAPI(lifespan=lifespan)
+
+class TokenBucket:
+    """
+    Async token bucket rate limiter. Holds up to `capacity` tokens and refills
+    `rate` tokens per `period` seconds; each acquire() spends one token.
+    """
+    def __init__(self, rate: int, period: float, capacity: Optional[int] = None):
+        self.rate_per_second = rate / period
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate_per_second)
+
+
+wom_rate_limiter = TokenBucket(rate=WOM_RATE_LIMIT, period=WOM_RATE_PERIOD_SECONDS, capacity=WOM_RATE_BURST)
+wom_fetch_semaphore = asyncio.Semaphore(WOM_MAX_CONCURRENCY)
+wom_metric_latencies_ms: Dict[str, float] = {}
+# Last CSV digest and the boards built from it, per metric. WOM's CSV endpoint
+# sends no validators and wom.py exposes no request headers, so unchanged
+# content is detected by hashing the body instead of a conditional request.
+wom_csv_boards: Dict[str, tuple] = {}
+wom_csv_stats: Dict[str, Dict[str, int]] = {}
+wom_standings: Dict[str, Dict] = {}
+
+
+async def _fetch_wom_metric_csv(wom_client: wom.Client, metric: str) -> Optional[str]:
+    async with wom_fetch_semaphore:
+        await wom_rate_limiter.acquire()
+        started = time.perf_counter()
+        response: wom.Result = await wom_client.competitions.get_details_csv(
+            id=WOM_COMPETITION_ID, metric=metric # type: ignore
         )
-        
-async def _get_items_obtained_leaderboard_helper() -> List[Dict]:
-    logger.info("Fetching Items Obtained leaderboard data from MongoDB.")
-    leaderboard_entries: List[Dict] = []
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+    wom_metric_latencies_ms[metric] = elapsed_ms
+    logger.info(f"Fetched {metric} from WOM CSV endpoint in {elapsed_ms:.0f} ms.")
+
+    if response.is_ok:
+        return response.unwrap()
+    logger.error(f"Failed to fetch {metric} competition details from WOM CSV (is_ok=False): {response.unwrap_err().message}")
+    return None
+
+
+class WomCsvRow(NamedTuple):
+    rsn: str
+    team: Optional[str]
+    gained: float
+
+
+WOM_TEAM_CLANS = {"Iron Foundry": CLAN_INDEXES["ironfoundry"], "Ironclad": CLAN_INDEXES["ironclad"]}
+
+
+def _parse_gained(raw: str) -> float:
     try:
-        cursor = players_coll_async.find({})
-        player_docs = await cursor.to_list(length=None)
+        gained = float(raw)
+    except ValueError:
+        return 0.0
+    return gained if gained == gained else 0.0 # NaN counts as nothing gained
+
+
+def _parse_wom_csv(csv_content: str) -> List[WomCsvRow]:
+    """Streams the WOM competition CSV into typed rows; only the columns a board needs are kept."""
+    reader = csv.reader(io.StringIO(csv_content))
+    header = next(reader, None)
+    if not header:
+        return []
+
+    columns = {name: i for i, name in enumerate(header)}
+    rsn_col, team_col, gained_col = columns.get("Username"), columns.get("Team"), columns.get("Gained")
+    rows: List[WomCsvRow] = []
+    for record in reader:
+        if not record:
+            continue
+        if len(record) < len(header):
+            record += [""] * (len(header) - len(record))
+        rows.append(WomCsvRow(
+            record[rsn_col] if rsn_col is not None else "N/A",
+            (record[team_col] or None) if team_col is not None else None,
+            _parse_gained(record[gained_col]) if gained_col is not None else 0.0,
+        ))
+    return rows
+
+
+def _build_wom_standings(metric: str, rows: List[WomCsvRow]) -> Dict:
+    """Per-team member count, total and average gained, and top contributors, in one pass over the rows."""
+    teams: Dict[str, list] = {} # team -> [members, total, min-heap of (gained, -position, rsn)]
+    for position, row in enumerate(rows):
+        if row.team is None:
+            continue
+        team = teams.setdefault(row.team, [0, 0.0, []])
+        team[0] += 1
+        team[1] += row.gained
+        entry = (row.gained, -position, row.rsn)
+        if len(team[2]) < WOM_STANDINGS_TOP:
+            heapq.heappush(team[2], entry)
+        elif WOM_STANDINGS_TOP:
+            heapq.heappushpop(team[2], entry)
+
+    standings = [
+        {
+            "team": name,
+            "clan": LEADERBOARD_CLANS[WOM_TEAM_CLANS.get(name, 0)],
+            "members": members,
+            "total": total,
+            "average": total / members,
+            "top": [{"rsn": rsn, "value": gained} for gained, _, rsn in sorted(top, reverse=True)],
+        }
+        for name, (members, total, top) in teams.items()
+    ]
+    standings.sort(key=operator.itemgetter("total"), reverse=True)
+    return {"metric": metric, "title": metric.replace('_', ' ').title(), "teams": standings}
+
+
+def _build_wom_leaderboard(metric: str, rows: List[WomCsvRow]) -> Optional[Dict]:
+    """Builds the board columns; sorts rows in place."""
+    if not rows:
+        logger.warning(f"CSV data for metric {metric} is empty. Skipping leaderboard generation.")
+        return None
+
+    logger.info(f"Successfully parsed {len(rows)} rows for {metric} from WOM CSV.")
 
-        processed_players_with_item_counts: List[Dict] = []
-        for doc in player_docs:
+    sort_key = operator.attrgetter("gained")
+    if WOM_BOARD_MAX_ROWS and len(rows) > WOM_BOARD_MAX_ROWS:
+        rows = heapq.nlargest(WOM_BOARD_MAX_ROWS, rows, key=sort_key)
+    else:
+        rows.sort(key=sort_key, reverse=True)
+
+    competition_page_url = f"https://wiseoldman.net/competitions/{WOM_COMPETITION_ID}?preview={metric.lower().replace(" ", "_")}"
+    
+    return {
+        "title": f"{metric.replace('_', ' ').title()}",
+        "metric_page": competition_page_url,
+        "rsn": [row.rsn for row in rows],
+        "value": [row.gained for row in rows],
+        "clan": [WOM_TEAM_CLANS.get(row.team, 0) for row in rows],
+    }
+
+
+def _player_total_gained(doc: Dict[str, Any]) -> Optional[float]:
+    value = doc.get("total_gained")
+    return value if isinstance(value, (int, float)) else None
+
+
+def _player_items_obtained(doc: Dict[str, Any]) -> Optional[int]:
+    obtained_items = doc.get("obtained_items") or {}
+    return sum(int(count) for count in obtained_items.values() if isinstance(count, (int, float)))
+
+
+def _player_pets_obtained(doc: Dict[str, Any]) -> Optional[int]:
+    obtained_items = doc.get("obtained_items") or {}
+    pet_count = 0
+    for item_key, count in obtained_items.items():
+        if isinstance(item_key, str) and item_key.startswith("Miscellaneous.Pets."):
+            pet_count += int(count) if isinstance(count, (int, float)) else 0
+    return pet_count if pet_count > 0 else None
+
+
+_OBTAINED_ITEMS_ARRAY = {"$objectToArray": {"$ifNull": ["$obtained_items", {}]}}
+
+
+def _sum_item_counts_expression(items_array: Dict) -> Dict:
+    return {"$sum": {"$map": {
+        "input": items_array,
+        "as": "item",
+        "in": {"$cond": [{"$isNumber": "$$item.v"}, {"$toInt": "$$item.v"}, 0]},
+    }}}
+
+
+# Every Mongo-backed board is built from the same Players scan. Each entry maps
+# a player document to the board value, or None to leave the player off it.
+# "expression"/"match" are the server-side equivalents used in aggregate mode.
+MONGO_LEADERBOARDS = [
+    {
+        "title": "Total Gained (Points)",
+        "value": _player_total_gained,
+        "expression": "$total_gained",
+        "match": {"value": {"$type": "number"}},
+    },
+    {
+        "title": "Items Obtained (Total)",
+        "value": _player_items_obtained,
+        "expression": _sum_item_counts_expression(_OBTAINED_ITEMS_ARRAY),
+        "match": {},
+    },
+    {
+        "title": "Pets Obtained",
+        "value": _player_pets_obtained,
+        "expression": _sum_item_counts_expression({"$filter": {
+            "input": _OBTAINED_ITEMS_ARRAY,
+            "as": "item",
+            "cond": {"$eq": [{"$indexOfCP": ["$$item.k", "Miscellaneous.Pets."]}, 0]},
+        }}),
+        "match": {"value": {"$gt": 0}},
+    },
+]
+MONGO_BOARD_SLUGS = {_board_slug(leaderboard["title"]) for leaderboard in MONGO_LEADERBOARDS}
+# "scan" streams projected Players documents and scores them in Python,
+# "aggregate" runs one pipeline per board so only rsn, clan and value cross the wire.
+MONGO_LEADERBOARD_MODE = os.getenv("MONGO_LEADERBOARD_MODE", "scan")
+# "changestream" or "poll" keep the Mongo boards updated between refreshes,
+# "off" rebuilds them on every refresh.
+MONGO_LEADERBOARD_SYNC = os.getenv("MONGO_LEADERBOARD_SYNC", "off")
+MONGO_SYNC_POLL_SECONDS = float(os.getenv("MONGO_SYNC_POLL_SECONDS", "10"))
+PLAYERS_SCAN_PROJECTION = {"_id": 1, "rsn": 1, "clan": 1, "total_gained": 1, "obtained_items": 1}
+PLAYERS_SCAN_BATCH_SIZE = int(os.getenv("PLAYERS_SCAN_BATCH_SIZE", "500"))
+
+
+class SortedLeaderboard:
+    """
+    A Mongo-backed board kept sorted by value (descending, ties by player id)
+    in parallel columns, so a single player's change only moves that player's
+    entry instead of rebuilding the whole board. Ranks are list positions.
+    """
+    def __init__(self, board: Dict):
+        self.board = board
+        self.keys: List[tuple] = []
+        self.rsns: List[str] = []
+        self.values: List[Any] = []
+        self.clans: List[int] = []
+        self.player_keys: Dict[str, tuple] = {}
+
+    def load(self, entries: List[tuple]):
+        entries = sorted(entries, key=lambda entry: (-entry[1], entry[0]))
+        self.keys = [(-value, player_id) for player_id, value, _, _ in entries]
+        self.rsns = [rsn for _, _, rsn, _ in entries]
+        self.values = [value for _, value, _, _ in entries]
+        self.clans = [CLAN_INDEXES.get(clan, 0) for _, _, _, clan in entries]
+        self.player_keys = {player_id: key for key, (player_id, _, _, _) in zip(self.keys, entries)}
+
+    def _delete(self, position: int):
+        for column in (self.keys, self.rsns, self.values, self.clans):
+            del column[position]
+
+    def remove(self, player_id: str) -> bool:
+        key = self.player_keys.pop(player_id, None)
+        if key is None:
+            return False
+        self._delete(bisect.bisect_left(self.keys, key))
+        return True
+
+    def upsert(self, player_id: str, value: Any, rsn: str, clan: Optional[str]) -> bool:
+        if value is None:
+            return self.remove(player_id)
+
+        key = (-value, player_id)
+        clan_index = CLAN_INDEXES.get(clan, 0)
+        old_key = self.player_keys.get(player_id)
+        if old_key is not None:
+            old_position = bisect.bisect_left(self.keys, old_key)
+            if old_key == key and self.rsns[old_position] == rsn and self.clans[old_position] == clan_index:
+                return False
+            self._delete(old_position)
+
+        position = bisect.bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.rsns.insert(position, rsn)
+        self.values.insert(position, value)
+        self.clans.insert(position, clan_index)
+        self.player_keys[player_id] = key
+        return True
+
+    def to_leaderboard(self) -> Optional[Dict]:
+        if not self.rsns:
+            return None
+        return {
+            "title": self.board["title"],
+            "metric_page": None,
+            "rsn": list(self.rsns),
+            "value": list(self.values),
+            "clan": list(self.clans),
+        }
+
+
+mongo_sorted_boards: Optional[List[SortedLeaderboard]] = None
+# Bumped whenever the sorted boards change, so unchanged boards are handed out as the very same list.
+mongo_boards_generation = 0
+mongo_boards_built: Optional[Tuple[int, List[Dict]]] = None
+
+
+# Normalized rsn -> the player's profile fields, for /players/{rsn}. Complete after a Players scan
+# and kept current by the sync; the aggregate pipelines return no items, so it then fills on demand.
+mongo_player_profiles: Dict[str, Dict[str, Any]] = {}
+mongo_profile_keys: Dict[str, str] = {} # Player id -> its key in mongo_player_profiles
+mongo_player_profiles_complete = False
+
+
+def _set_player_profile(player_id: str, doc: Optional[Dict[str, Any]]):
+    """Stores one player's current document (None when deleted) in the profile index."""
+    old_key = mongo_profile_keys.pop(player_id, None)
+    if old_key is not None:
+        mongo_player_profiles.pop(old_key, None)
+    rsn = doc.get("rsn") if doc else None
+    if isinstance(rsn, str):
+        key = _normalize_rsn(rsn)
+        mongo_player_profiles[key] = {field: doc.get(field) for field in PLAYERS_SCAN_PROJECTION if field != "_id"}
+        mongo_profile_keys[player_id] = key
+
+
+def _load_mongo_sorted_boards(board_entries: List[List[tuple]]) -> List[Dict]:
+    global mongo_sorted_boards, mongo_boards_generation
+    sorted_boards = [SortedLeaderboard(board) for board in MONGO_LEADERBOARDS]
+    for sorted_board, entries in zip(sorted_boards, board_entries):
+        sorted_board.load(entries)
+    mongo_sorted_boards = sorted_boards
+    mongo_boards_generation += 1
+    return _current_mongo_leaderboards()
+
+
+def _current_mongo_leaderboards() -> List[Dict]:
+    global mongo_boards_built
+    if mongo_boards_built is None or mongo_boards_built[0] != mongo_boards_generation:
+        boards = (sorted_board.to_leaderboard() for sorted_board in mongo_sorted_boards or [])
+        mongo_boards_built = (mongo_boards_generation, [board for board in boards if board])
+    return mongo_boards_built[1]
+
+
+def _mongo_leaderboard_pipeline(board: Dict) -> List[Dict]:
+    return [
+        {"$project": {"_id": 1, "rsn": 1, "clan": 1, "value": board["expression"]}},
+        {"$match": {"rsn": {"$type": "string"}, **board["match"]}},
+        {"$sort": {"value": -1, "_id": 1}},
+    ]
+
+
+async def _aggregate_mongo_leaderboard(board: Dict) -> List[tuple]:
+    cursor = await players_coll_async.aggregate(
+        _mongo_leaderboard_pipeline(board), allowDiskUse=True, batchSize=PLAYERS_SCAN_BATCH_SIZE
+    )
+    return [(str(doc["_id"]), doc["value"], doc["rsn"], doc.get("clan")) async for doc in cursor]
+
+
+async def _get_mongo_leaderboards_data_helper() -> List[Dict]:
+    logger.info(f"Building {len(MONGO_LEADERBOARDS)} leaderboards from a single Players scan.")
+    global mongo_player_profiles_complete
+    board_entries: List[List[tuple]] = [[] for _ in MONGO_LEADERBOARDS]
+    try:
+        scanned = 0
+        mongo_player_profiles.clear()
+        mongo_profile_keys.clear()
+        mongo_player_profiles_complete = False
+        cursor = players_coll_async.find({}, PLAYERS_SCAN_PROJECTION, batch_size=PLAYERS_SCAN_BATCH_SIZE)
+        async for doc in cursor:
+            scanned += 1
             rsn = doc.get("rsn")
-            clan = doc.get("clan")
-            obtained_items = doc.get("obtained_items", {}) # Should be a dict
-            
             if not isinstance(rsn, str):
-                logger.warning(f"Skipping Items Obtained entry due to non-string RSN for doc: {doc.get('_id')}")
+                logger.warning(f"Skipping leaderboard entries due to non-string RSN for doc: {doc.get('_id')}")
                 continue
+            player_id = str(doc["_id"])
+            clan = doc.get("clan")
+            _set_player_profile(player_id, doc)
 
-            total_items_obtained = sum(int(count) for count in obtained_items.values() if isinstance(count, (int, float)))
-            
-            processed_players_with_item_counts.append({
-                "rsn": rsn,
-                "total_items": total_items_obtained,
-                "clan": clan,
-                "profile_link_base": f"https://wiseoldman.net/players/{str(rsn).replace(' ', '%20')}"
-            })
-        
-        sorted_players = sorted(processed_players_with_item_counts, key=lambda p: p.get("total_items", 0), reverse=True)
-
-        rows: List[Dict] = []
-        for i, player_data in enumerate(sorted_players):
-            icon_link = ""
-            if player_data.get("clan") == "ironfoundry":
-                icon_link = foundry_link
-            elif player_data.get("clan") == "ironclad":
-                icon_link = clad_link
-            
-            rows.append({
-                "index": i + 1,
-                "rsn": player_data["rsn"],
-                "value": player_data["total_items"],
-                "profile_link": player_data["profile_link_base"],
-                "icon_link": icon_link,
-            })
-        
-        if rows:
-            leaderboard_entries.append({
-                "title": "Items Obtained (Total)",
-                "metric_page": None,
-                "data": rows
-            })
+            for board, entries in zip(MONGO_LEADERBOARDS, board_entries):
+                value = board["value"](doc)
+                if value is not None:
+                    entries.append((player_id, value, rsn, clan))
+
+        leaderboard_entries = _load_mongo_sorted_boards(board_entries)
+        mongo_player_profiles_complete = True
+        logger.info(f"Scanned {scanned} players into {len(leaderboard_entries)} MongoDB leaderboards.")
         return leaderboard_entries
     except Exception as e:
-        logger.error(f"Error fetching Items Obtained leaderboard from MongoDB: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch Items Obtained leaderboard: {e}")
+        logger.error(f"Error building MongoDB leaderboards: {e}", exc_info=True)
+        raise
 
 
-async def _get_pets_obtained_leaderboard_helper() -> List[Dict]:
-    logger.info("Fetching Pets Obtained leaderboard data from MongoDB.")
-    leaderboard_entries: List[Dict] = []
+async def _get_mongo_leaderboards_aggregate_helper() -> List[Dict]:
+    global mongo_player_profiles_complete
+    logger.info(f"Building {len(MONGO_LEADERBOARDS)} leaderboards with MongoDB aggregation pipelines.")
     try:
-        cursor = players_coll_async.find({})
-        player_docs = await cursor.to_list(length=None)
+        board_entries = await asyncio.gather(*(_aggregate_mongo_leaderboard(board) for board in MONGO_LEADERBOARDS))
+        mongo_player_profiles.clear()
+        mongo_profile_keys.clear()
+        mongo_player_profiles_complete = False
+        return _load_mongo_sorted_boards(list(board_entries))
+    except Exception as e:
+        logger.error(f"Error aggregating MongoDB leaderboards: {e}", exc_info=True)
+        raise
 
-        processed_players_with_pet_counts: List[Dict] = []
-        for doc in player_docs:
-            rsn = doc.get("rsn")
-            clan = doc.get("clan")
-            obtained_items = doc.get("obtained_items", {})
-            
-            if not isinstance(rsn, str):
-                logger.warning(f"Skipping Pets Obtained entry due to non-string RSN for doc: {doc.get('_id')}")
-                continue
 
-            pet_count = 0
-            for item_key, count in obtained_items.items():
-                if isinstance(item_key, str) and item_key.startswith("Miscellaneous.Pets."):
-                    pet_count += int(count) if isinstance(count, (int, float)) else 0
-            
-            if pet_count > 0:
-                processed_players_with_pet_counts.append({
-                    "rsn": rsn,
-                    "total_pets": pet_count,
-                    "clan": clan,
-                    "profile_link_base": f"https://wiseoldman.net/players/{str(rsn).replace(' ', '%20')}"
-                })
-        
-        sorted_players = sorted(processed_players_with_pet_counts, key=lambda p: p.get("total_pets", 0), reverse=True)
-
-        rows: List[Dict] = []
-        for i, player_data in enumerate(sorted_players):
-            icon_link = ""
-            if player_data.get("clan") == "ironfoundry":
-                icon_link = foundry_link
-            elif player_data.get("clan") == "ironclad":
-                icon_link = clad_link
-            
-            rows.append({
-                "index": i + 1,
-                "rsn": player_data["rsn"],
-                "value": player_data["total_pets"],
-                "profile_link": player_data["profile_link_base"],
-                "icon_link": icon_link,
-            })
-        
-        if rows:
-            leaderboard_entries.append({
-                "title": "Pets Obtained",
-                "metric_page": None,
-                "data": rows
-            })
-        return leaderboard_entries
-    except Exception as e:
-        logger.error(f"Error fetching Pets Obtained leaderboard from MongoDB: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch Pets Obtained leaderboard: {e}")
+def _apply_player_change(player_id: str, doc: Optional[Dict[str, Any]]) -> bool:
+    """Applies one player's current document (None when deleted) to every sorted board."""
+    global mongo_boards_generation
+    _set_player_profile(player_id, doc)
+    changed = False
+    for sorted_board in mongo_sorted_boards or []:
+        rsn = doc.get("rsn") if doc else None
+        if not isinstance(rsn, str):
+            changed |= sorted_board.remove(player_id)
+            continue
+        value = sorted_board.board["value"](doc)
+        changed |= sorted_board.upsert(player_id, value, rsn, doc.get("clan"))
+    if changed:
+        mongo_boards_generation += 1
+    return changed
 
 
-async def _get_all_leaderboards_data() -> List[Dict]:
-    logger.info("Starting to compile all leaderboard data from various sources.")
-    combined_leaderboards: List[Dict] = []
+def _publish_mongo_leaderboards():
+    mongo_source = leaderboard_sources["mongo"]
+    # Published live here; the source's next refresh records history and the snapshot for it.
+    mongo_source.update(boards=_current_mongo_leaderboards(), updated_at=time.time(), error=None, failures=0, changed=True)
+    _publish_leaderboards()
+    logger.info("Published incremental MongoDB leaderboard update.")
 
-    try:
-        # 1. Wise Old Man CSV Leaderboard
-        wom_data = await _get_wom_leaderboards_data_helper()
-        combined_leaderboards.extend(wom_data)
-        logger.info(f"Added {len(wom_data)} leaderboards from Wiseoldman CSV.")
-        
-        # 2. MongoDB: Total Gained Leaderboard
-        total_gained_data = await _get_total_gained_leaderboard_helper()
-        combined_leaderboards.extend(total_gained_data)
-        logger.info(f"Added {len(total_gained_data)} leaderboards for Total Gained from MongoDB.")
 
-        # 3. MongoDB: Items Obtained Leaderboard
-        items_obtained_data = await _get_items_obtained_leaderboard_helper()
-        combined_leaderboards.extend(items_obtained_data)
-        logger.info(f"Added {len(items_obtained_data)} leaderboards for Items Obtained from MongoDB.")
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost: the stored resume token is unusable.
+CHANGE_STREAM_RESUME_LOST_CODES = {260, 280, 286}
 
-        # 4. MongoDB: Pets Obtained Leaderboard
-        pets_obtained_data = await _get_pets_obtained_leaderboard_helper()
-        combined_leaderboards.extend(pets_obtained_data)
-        logger.info(f"Added {len(pets_obtained_data)} leaderboards for Pets Obtained from MongoDB.")
 
-        logger.info(f"Finished combining all leaderboards. Total: {len(combined_leaderboards)}.")
-        return combined_leaderboards
+async def _watch_players_change_stream():
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+        {"$project": {"operationType": 1, "documentKey": 1, **{f"fullDocument.{field}": 1 for field in PLAYERS_SCAN_PROJECTION}}},
+    ]
+    resume_token = None
+    retry_delay = 1
 
-    except HTTPException:
-        raise
+    while True:
+        try:
+            async with await players_coll_async.watch(
+                pipeline, full_document="updateLookup", resume_after=resume_token, max_await_time_ms=1000
+            ) as stream:
+                logger.info("Watching Players change stream for leaderboard updates.")
+                if resume_token is None:
+                    await _get_mongo_leaderboards_data_helper()
+                    _publish_mongo_leaderboards()
+                retry_delay = 1
+
+                changed = False
+                while stream.alive:
+                    change = await stream.try_next()
+                    resume_token = stream.resume_token
+                    if change is not None:
+                        doc = None if change["operationType"] == "delete" else change.get("fullDocument")
+                        changed |= _apply_player_change(str(change["documentKey"]["_id"]), doc)
+                        continue
+                    if changed:
+                        _publish_mongo_leaderboards()
+                        changed = False
+
+        except OperationFailure as e:
+            if e.code == 40573: # The $changeStream stage is only supported on replica sets
+                logger.warning("Change streams are unavailable on this deployment. Falling back to updated_at polling.")
+                await _poll_players_updates()
+                return
+            if e.code in CHANGE_STREAM_RESUME_LOST_CODES and resume_token is not None:
+                # Resuming can never succeed; reopen fresh, which rescans Players before applying changes.
+                logger.warning(f"Players change stream can no longer resume (code {e.code}). Reopening it with a full rescan.")
+                resume_token = None
+                retry_delay = 1
+                continue
+            logger.error(f"Players change stream failed: {e}. Retrying in {retry_delay}s.", exc_info=True)
+        except Exception as e:
+            logger.error(f"Players change stream failed: {e}. Retrying in {retry_delay}s.", exc_info=True)
+
+        await asyncio.sleep(retry_delay)
+        retry_delay = min(retry_delay * 2, 60)
+
+
+async def _poll_players_updates():
+    watermark = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    while mongo_sorted_boards is None:
+        try:
+            await _get_mongo_leaderboards_data_helper()
+            _publish_mongo_leaderboards()
+        except Exception as e:
+            logger.error(f"Initial Players scan for polling failed: {e}", exc_info=True)
+            await asyncio.sleep(MONGO_SYNC_POLL_SECONDS)
+
+    logger.info(f"Polling Players for updated_at changes every {MONGO_SYNC_POLL_SECONDS}s.")
+    while True:
+        await asyncio.sleep(MONGO_SYNC_POLL_SECONDS)
+        try:
+            changed = False
+            cursor = players_coll_async.find(
+                {"updated_at": {"$gte": watermark}}, {**PLAYERS_SCAN_PROJECTION, "updated_at": 1}
+            ).sort("updated_at", 1)
+            async for doc in cursor:
+                changed |= _apply_player_change(str(doc["_id"]), doc)
+                watermark = max(watermark, doc["updated_at"])
+            if changed:
+                _publish_mongo_leaderboards()
+        except Exception as e:
+            logger.error(f"Polling Players for leaderboard updates failed: {e}", exc_info=True)
+
+
+async def _sync_mongo_leaderboards():
+    if MONGO_LEADERBOARD_SYNC == "changestream":
+        await _watch_players_change_stream()
+    elif MONGO_LEADERBOARD_SYNC == "poll":
+        await _poll_players_updates()
+
+
+async def _refresh_wom_source(metric: str) -> List[Dict]:
+    csv_content = await _fetch_wom_metric_csv(app.state.wom_client, metric)
+    if csv_content is None:
+        raise RuntimeError(f"WOM returned an error for metric {metric}.")
+
+    digest = hashlib.blake2b(csv_content.encode(), digest_size=16).digest()
+    stats = wom_csv_stats.setdefault(metric, {"parsed": 0, "unchanged": 0})
+    cached = wom_csv_boards.get(metric)
+    if cached and cached[0] == digest:
+        stats["unchanged"] += 1
+        logger.info(f"WOM CSV for {metric} is unchanged; reusing the built board.")
+        return cached[1]
+
+    rows = _parse_wom_csv(csv_content)
+    # Standings first: building the board sorts and may truncate the rows.
+    wom_standings[metric] = _build_wom_standings(metric, rows)
+    leaderboard = _build_wom_leaderboard(metric, rows) if metric in WOM_METRICS else None
+    boards = [leaderboard] if leaderboard else []
+    wom_csv_boards[metric] = (digest, boards)
+    stats["parsed"] += 1
+    return boards
+
+
+async def _refresh_mongo_source() -> List[Dict]:
+    if MONGO_LEADERBOARD_SYNC != "off" and mongo_sorted_boards is not None:
+        return _current_mongo_leaderboards()
+    if MONGO_LEADERBOARD_MODE == "aggregate":
+        return await _get_mongo_leaderboards_aggregate_helper()
+    return await _get_mongo_leaderboards_data_helper()
+
+
+def _new_leaderboard_source(name: str, refresh: Callable[[], Awaitable[List[Dict]]], interval: float) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "refresh": refresh,
+        "interval": REFRESH_INTERVAL_OVERRIDES.get(name, interval),
+        "boards": [],          # Last good boards, served while a refresh fails
+        "updated_at": None,    # Wall-clock time of the last successful refresh
+        "error": None,
+        "failures": 0,
+        "changed": False,      # New boards not yet published, recorded to history and snapshotted
+        "in_flight": None,     # Running refresh, shared by concurrent callers
+        "next_refresh_at": 0.0,
+    }
+
+
+# Every source refreshes on its own schedule and keeps its last good boards.
+# WOM metrics are one source each; the Mongo boards share one Players scan.
+leaderboard_sources: Dict[str, Dict[str, Any]] = {
+    **{
+        metric: _new_leaderboard_source(metric, functools.partial(_refresh_wom_source, metric), WOM_REFRESH_SECONDS)
+        for metric in WOM_METRICS + [metric for metric in WOM_STANDINGS_METRICS if metric not in WOM_METRICS]
+    },
+    "mongo": _new_leaderboard_source("mongo", _refresh_mongo_source, MONGO_REFRESH_SECONDS),
+}
+
+
+def _apply_leaderboards(combined_data: List[Dict]):
+    previous_boards = leaderboards_cache.get('leaderboard_boards')
+    _set_leaderboards_cache(combined_data)
+    if previous_boards is not None:
+        _publish_leaderboard_changes(previous_boards, leaderboards_cache['leaderboard_boards'])
+
+
+def _set_standings_cache():
+    leaderboards_cache['standings_encoded'] = _encode_payload({"Data": [
+        wom_standings[name] for name in leaderboard_sources if name in wom_standings
+    ]})
+
+
+def _publish_leaderboards():
+    _apply_leaderboards([board for source in leaderboard_sources.values() for board in source["boards"]])
+    _set_standings_cache()
+
+
+async def _refresh_leaderboard_source(source: Dict[str, Any]) -> bool:
+    """Single-flight per source: callers arriving mid-refresh share the running refresh."""
+    if source["in_flight"] is None or source["in_flight"].done():
+        source["in_flight"] = asyncio.ensure_future(_run_leaderboard_source_refresh(source))
+    return await asyncio.shield(source["in_flight"])
+
+
+async def _run_leaderboard_source_refresh(source: Dict[str, Any]) -> bool:
+    try:
+        boards = await source["refresh"]()
     except Exception as e:
-        logger.error(f"An unexpected error occurred in _get_all_leaderboards_data: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to compile all leaderboard data: {e}"
-        )        
-        
-            
-def find_milestone_doc_sync(template_doc: Dict[str, Any], category: str, metric_name: str) -> Optional[Dict[str, Any]]:
-    milestones_data = template_doc.get("milestones", {})
-    category_list = milestones_data.get(category)
-    if not category_list:
+        source["failures"] += 1
+        source["error"] = str(e)
+        retry_in = min(REFRESH_RETRY_SECONDS * 2 ** (source["failures"] - 1), REFRESH_MAX_BACKOFF_SECONDS)
+        source["next_refresh_at"] = time.monotonic() + retry_in
+        logger.error(
+            f"Refreshing leaderboard source '{source['name']}' failed ({source['failures']} in a row): {e}. "
+            f"Serving last good data, retrying in {retry_in:.0f}s.",
+            exc_info=True
+        )
+        return False
+
+    # Sources hand back the very same list when their data did not change; a sync
+    # publisher that already swapped in new boards leaves changed set instead.
+    changed = source["changed"] or boards is not source["boards"]
+    source.update(changed=changed, boards=boards, updated_at=time.time(), error=None, failures=0)
+    source["next_refresh_at"] = time.monotonic() + source["interval"]
+    return True
+
+
+leaderboard_refresh_in_flight: Optional[asyncio.Future] = None
+
+
+async def _refresh_due_leaderboard_sources(force: bool = False) -> int:
+    """Single-flight: a call made while a refresh is running waits for it instead of starting another."""
+    global leaderboard_refresh_in_flight
+    if leaderboard_refresh_in_flight is None or leaderboard_refresh_in_flight.done():
+        leaderboard_refresh_in_flight = asyncio.ensure_future(_run_due_leaderboard_refresh(force))
+    return await asyncio.shield(leaderboard_refresh_in_flight)
+
+
+async def _run_due_leaderboard_refresh(force: bool) -> int:
+    now = time.monotonic()
+    due_sources = [source for source in leaderboard_sources.values() if force or source["next_refresh_at"] <= now]
+    if not due_sources:
+        return 0
+
+    logger.info(f"Refreshing leaderboard sources: {', '.join(source['name'] for source in due_sources)}.")
+    await _refresh_leaderboard_sources(due_sources)
+    return len(due_sources)
+
+
+async def _refresh_leaderboard_sources(sources: List[Dict[str, Any]]) -> List[bool]:
+    """Refreshes the given sources, then publishes, records history and snapshots once if any changed."""
+    results = await asyncio.gather(*(_refresh_leaderboard_source(source) for source in sources))
+    # Consume the changed flags so callers that joined the same refresh publish it only once.
+    changed_sources = [source for source, ok in zip(sources, results) if ok and source["changed"]]
+    for source in changed_sources:
+        source["changed"] = False
+    if changed_sources:
+        _publish_leaderboards()
+        logger.info(
+            f"Leaderboard cache updated ({sum(results)}/{len(sources)} sources refreshed, "
+            f"{len(changed_sources)} changed)."
+        )
+        if LEADERBOARD_HISTORY != "off":
+            refreshed_boards = [board for source in changed_sources for board in source["boards"]]
+            try:
+                await _record_leaderboard_history(refreshed_boards)
+            except Exception as e:
+                logger.error(f"Recording leaderboard history failed: {e}", exc_info=True)
+        try:
+            await _save_leaderboard_snapshot()
+        except Exception as e:
+            logger.error(f"Writing the leaderboard snapshot failed: {e}", exc_info=True)
+    return results
+
+
+def _find_leaderboard_source(board: str) -> Optional[Dict[str, Any]]:
+    """Resolves a source name or board slug to the source that builds it."""
+    if board in leaderboard_sources:
+        return leaderboard_sources[board]
+    if board in MONGO_BOARD_SLUGS:
+        return leaderboard_sources["mongo"]
+    return next(
+        (source for source in leaderboard_sources.values() if any(_board_slug(b["title"]) == board for b in source["boards"])),
+        None,
+    )
+
+
+def _write_snapshot_file(path: str, snapshot: Dict[str, Any]):
+    data = gzip.compress(msgspec.json.encode(snapshot, enc_hook=str), compresslevel=6)
+    # Each write gets its own temp file, so workers saving the same snapshot never interleave.
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path), suffix=".tmp", delete=False) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f.name, path) # Atomic, so a crash never leaves a half-written snapshot
+    return len(data)
+
+
+async def _save_leaderboard_snapshot():
+    if not LEADERBOARD_SNAPSHOT_PATH:
+        return
+    snapshot = {
+        "format": LEADERBOARD_SNAPSHOT_FORMAT,
+        "saved_at": time.time(),
+        "sources": {
+            name: {"boards": source["boards"], "updated_at": source["updated_at"]}
+            for name, source in leaderboard_sources.items()
+            if source["updated_at"]
+        },
+        "standings": wom_standings,
+    }
+    size = await asyncio.to_thread(_write_snapshot_file, LEADERBOARD_SNAPSHOT_PATH, snapshot)
+    logger.info(f"Wrote leaderboard snapshot to {LEADERBOARD_SNAPSHOT_PATH} ({size} bytes).")
+
+
+def _load_leaderboard_snapshot() -> bool:
+    """
+    Restores every source's last good boards from the snapshot and publishes
+    them. Sources are scheduled for when their data would have gone stale, so a
+    quick restart does not trigger a full crawl.
+    """
+    if not LEADERBOARD_SNAPSHOT_PATH or not os.path.exists(LEADERBOARD_SNAPSHOT_PATH):
+        return False
+    try:
+        with open(LEADERBOARD_SNAPSHOT_PATH, "rb") as f:
+            snapshot = msgspec.json.decode(gzip.decompress(f.read()))
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable leaderboard snapshot {LEADERBOARD_SNAPSHOT_PATH}: {e}")
+        return False
+    if snapshot.get("format") != LEADERBOARD_SNAPSHOT_FORMAT:
+        logger.warning(f"Ignoring leaderboard snapshot {LEADERBOARD_SNAPSHOT_PATH} written in an older format.")
+        return False
+
+    now = time.time()
+    monotonic_now = time.monotonic()
+    for name, saved in snapshot["sources"].items():
+        source = leaderboard_sources.get(name)
+        if source is None:
+            continue
+        source.update(boards=saved["boards"], updated_at=saved["updated_at"])
+        source["next_refresh_at"] = monotonic_now + max(0.0, source["interval"] - (now - saved["updated_at"]))
+    wom_standings.update(snapshot.get("standings", {}))
+
+    _publish_leaderboards()
+    logger.info(f"Loaded leaderboard snapshot from {round(now - snapshot['saved_at'])}s ago ({len(snapshot['sources'])} sources).")
+    return True
+
+
+# Last recorded {rsn: (value, rank)} per board and snapshots written since its keyframe.
+history_last_rows: Dict[str, Dict[str, tuple]] = {}
+history_last_clans: Dict[str, Dict[str, tuple]] = {}
+history_snapshot_counts: Dict[str, int] = {}
+history_indexes_ready = False
+
+
+async def _ensure_history_indexes():
+    global history_indexes_ready
+    if history_indexes_ready:
+        return
+    await history_snapshots_coll_async.create_index([("board", 1), ("ts", 1)])
+    await history_series_coll_async.create_index([("board", 1), ("series", 1), ("key", 1), ("day", 1)], unique=True)
+    history_indexes_ready = True
+
+
+def _clan_history_rows(rows: Dict[str, tuple], clans: Dict[str, Optional[str]]) -> Dict[str, tuple]:
+    """Per-clan (total value, player count, best rank) for one board."""
+    totals: Dict[str, list] = {}
+    for rsn, (value, rank) in rows.items():
+        clan = clans.get(rsn)
+        if clan is None:
+            continue
+        total = totals.setdefault(clan, [0, 0, rank])
+        total[0] += value
+        total[1] += 1
+        total[2] = min(total[2], rank)
+    return {clan: tuple(total) for clan, total in totals.items()}
+
+
+async def _record_leaderboard_history(boards: List[Dict]):
+    """
+    Appends one snapshot per changed board: a keyframe of parallel rsn/value/rank
+    arrays, or only the rows that changed since the previous snapshot. The same
+    changes are pushed onto per-player and per-clan daily series so history
+    queries never read the snapshots.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    epoch = int(now.timestamp())
+    day = now.strftime("%Y-%m-%d")
+    snapshots: List[Dict[str, Any]] = []
+    series_ops: List[UpdateOne] = []
+    recorded_rows: Dict[str, Dict[str, tuple]] = {}
+    recorded_clans: Dict[str, Dict[str, tuple]] = {}
+
+    def push_point(board: str, series: str, key: str, point: list):
+        series_ops.append(UpdateOne(
+            {"board": board, "series": series, "key": key, "day": day},
+            {"$push": {"points": point}},
+            upsert=True,
+        ))
+
+    for leaderboard in boards:
+        board = _board_slug(leaderboard["title"])
+        # Keyed by normalized rsn, as /players/{rsn} looks players up, so a change of letter case or spacing keeps the series.
+        rows = {_normalize_rsn(rsn): (value, rank) for rank, rsn, value in zip(itertools.count(1), leaderboard["rsn"], leaderboard["value"])}
+        clans = {_normalize_rsn(rsn): LEADERBOARD_CLANS[clan] for rsn, clan in zip(leaderboard["rsn"], leaderboard["clan"])}
+        previous = history_last_rows.get(board)
+        count = history_snapshot_counts.get(board, 0)
+
+        changed = [rsn for rsn, row in rows.items() if previous is None or previous.get(rsn) != row]
+        removed = [rsn for rsn in previous if rsn not in rows] if previous is not None else []
+        if previous is not None and not changed and not removed:
+            continue
+
+        keyframe = previous is None or count >= HISTORY_KEYFRAME_EVERY
+        snapshot_rsns = list(rows) if keyframe else changed
+        snapshots.append({
+            "board": board,
+            "ts": now,
+            "keyframe": keyframe,
+            "rsns": snapshot_rsns,
+            "values": [rows[rsn][0] for rsn in snapshot_rsns],
+            "ranks": [rows[rsn][1] for rsn in snapshot_rsns],
+            "removed": removed,
+        })
+        recorded_rows[board] = rows
+
+        for rsn in changed:
+            push_point(board, "player", rsn, [epoch, rows[rsn][0], rows[rsn][1]])
+        for rsn in removed:
+            push_point(board, "player", rsn, [epoch, None, None])
+
+        clan_rows = _clan_history_rows(rows, clans)
+        previous_clans = history_last_clans.get(board, {})
+        for clan, total in clan_rows.items():
+            if previous_clans.get(clan) != total:
+                push_point(board, "clan", clan, [epoch, *total])
+        recorded_clans[board] = clan_rows
+
+    if not snapshots:
+        return
+
+    await _ensure_history_indexes()
+    await history_snapshots_coll_async.insert_many(snapshots, ordered=False)
+    if series_ops:
+        await history_series_coll_async.bulk_write(series_ops, ordered=False)
+
+    # Only advance the delta baseline once the snapshot is stored.
+    for snapshot in snapshots:
+        board = snapshot["board"]
+        history_snapshot_counts[board] = 1 if snapshot["keyframe"] else history_snapshot_counts.get(board, 0) + 1
+    history_last_rows.update(recorded_rows)
+    history_last_clans.update(recorded_clans)
+    logger.info(
+        f"Recorded leaderboard history: {len(snapshots)} snapshot(s) "
+        f"({sum(snapshot['keyframe'] for snapshot in snapshots)} keyframe), {len(series_ops)} series point(s)."
+    )
+
+
+def _downsample_history(points: List[list], since: int, until: int, max_points: int) -> List[list]:
+    """
+    Keeps the last point in each of max_points equal time buckets. Series only
+    record changes, so the last point before `since` is carried in as the start.
+    """
+    earlier = [point for point in points if point[0] < since]
+    points = [point for point in points if since <= point[0] <= until]
+    if earlier:
+        points.insert(0, [since, *earlier[-1][1:]])
+    if len(points) <= max_points:
+        return points
+    bucket_seconds = (until - since) / max_points or 1
+    downsampled: Dict[int, list] = {}
+    for point in points:
+        downsampled[int((point[0] - since) // bucket_seconds)] = point
+    return list(downsampled.values())
+
+
+template_cache: Dict[str, Dict[str, Any]] = {}
+template_cache_locks = {clan: asyncio.Lock() for clan in template_colls_async}
+
+
+def _index_template(template_doc: Dict[str, Any]) -> Dict[str, Dict[tuple, Any]]:
+    """Flattens a template into the keyed parts a delta is built from."""
+    index: Dict[str, Dict[tuple, Any]] = {
+        "items": {}, "sources": {}, "tiers": {}, "multipliers": {}, "milestones": {}, "activities": {}
+    }
+    for tier_name, tier_data in (template_doc.get("tiers") or {}).items():
+        index["tiers"][(tier_name,)] = tier_data.get("points_gained")
+        for source_data in tier_data.get("sources", []):
+            source_name = source_data.get("name")
+            index["sources"][(tier_name, source_name)] = source_data.get("source_gained")
+            for item_data in source_data.get("items", []):
+                index["items"][(tier_name, source_name, item_data.get("name"))] = item_data
+    for multiplier in template_doc.get("multipliers", []):
+        index["multipliers"][(multiplier.get("name"),)] = multiplier.get("unlocked", False)
+    for category, milestones in (template_doc.get("milestones") or {}).items():
+        for milestone in milestones:
+            index["milestones"][(category, milestone.get("name"))] = milestone
+    for activity in template_doc.get("activities", []):
+        index["activities"][(activity.get("name"),)] = activity
+    return index
+
+
+def _diff_templates(old_doc: Dict[str, Any], new_doc: Dict[str, Any]) -> Optional[Dict[str, Dict[tuple, Any]]]:
+    """
+    Returns the changed parts of new_doc keyed like _index_template, or None
+    when the template structure itself changed and clients need a full reload.
+    """
+    old_index = _index_template(old_doc)
+    new_index = _index_template(new_doc)
+    delta: Dict[str, Dict[tuple, Any]] = {}
+    for part, new_values in new_index.items():
+        old_values = old_index[part]
+        if old_values.keys() != new_values.keys():
+            return None
+        delta[part] = {key: value for key, value in new_values.items() if old_values[key] != value}
+    return delta
+
+
+def _serialize_template_delta(delta: Dict[str, Dict[tuple, Any]], template_doc: Dict[str, Any], since: int, version: int) -> Dict[str, Any]:
+    return {
+        "since": since,
+        "version": version,
+        "total_gained": template_doc.get("total_gained"),
+        "tiers": [{"tier": tier, "points_gained": points} for (tier,), points in delta["tiers"].items()],
+        "sources": [
+            {"tier": tier, "source": source, "source_gained": gained}
+            for (tier, source), gained in delta["sources"].items()
+        ],
+        "items": [{"tier": tier, "source": source, **item} for (tier, source, _), item in delta["items"].items()],
+        "multipliers": [{"name": name, "unlocked": unlocked} for (name,), unlocked in delta["multipliers"].items()],
+        "milestones": [{"category": category, **milestone} for (category, _), milestone in delta["milestones"].items()],
+        "activities": list(delta["activities"].values()),
+    }
+
+
+def _template_delta_since(entry: Dict[str, Any], since: int) -> Optional[Dict[str, Any]]:
+    """Encoded delta from `since` to the cached version, or None if it cannot be built from history."""
+    if since in entry["encoded_deltas"]:
+        return entry["encoded_deltas"][since]
+
+    history = entry["deltas"]
+    start = next((i for i, (from_version, _, _) in enumerate(history) if from_version == since), None)
+    if since != entry["version"] and start is None:
         return None
 
-    for milestone in category_list:
-        if milestone.get("name") == metric_name:
-            return milestone
-    return None
+    merged: Dict[str, Dict[tuple, Any]] = {part: {} for part in _index_template({})}
+    for _, _, delta in history[start:] if start is not None else []:
+        if delta is None:
+            return None
+        for part, values in delta.items():
+            merged[part].update(values)
+
+    template_doc = entry["docs"][0] if entry["docs"] else {}
+    encoded = _encode_payload(_serialize_template_delta(merged, template_doc, since, entry["version"]))
+    entry["encoded_deltas"][since] = encoded
+    return encoded
+
+
+def _publish_template_change(clan: str, since: int, version: int, delta: Optional[Dict[str, Dict[tuple, Any]]], template_doc: Dict[str, Any]):
+    if delta is None:
+        live_broadcaster.publish("template", {"clan": clan, "since": since, "version": version, "reload": True})
+        return
+
+    live_broadcaster.publish("template", {"clan": clan, **_serialize_template_delta(delta, template_doc, since, version)})
+    for (name,), unlocked in delta["multipliers"].items():
+        if unlocked:
+            live_broadcaster.publish("multiplier", {"clan": clan, "name": name, "version": version})
+
+
+async def _watch_templates_live():
+    """Re-checks template versions while anyone is on /live so changes are pushed, not just served."""
+    while True:
+        if live_broadcaster.listeners:
+            for clan in template_colls_async:
+                try:
+                    await _get_template_cache_entry(clan)
+                except Exception as e:
+                    logger.error(f"Live template check for '{clan}' failed: {e}")
+        await asyncio.sleep(TEMPLATE_VERSION_CHECK_SECONDS)
+
+
+async def _get_template_cache_entry(clan: str) -> Dict[str, Any]:
+    entry = template_cache.get(clan)
+    if entry and time.monotonic() - entry["checked_at"] < TEMPLATE_VERSION_CHECK_SECONDS:
+        return entry
+
+    async with template_cache_locks[clan]:
+        entry = template_cache.get(clan)
+        now = time.monotonic()
+        if entry and now - entry["checked_at"] < TEMPLATE_VERSION_CHECK_SECONDS:
+            return entry
+
+        collection = template_colls_async[clan]
+        if entry and now - entry["loaded_at"] < TEMPLATE_CACHE_MAX_AGE_SECONDS:
+            current = await collection.find_one({}, {"version": 1})
+            if current is not None and current.get("version", 0) == entry["version"]:
+                entry["checked_at"] = now
+                return entry
+
+        docs = await collection.find({}).to_list(length=None)
+        version = docs[0].get("version", 0) if docs else 0
+        deltas = entry["deltas"] if entry else []
+        if entry and entry["version"] != version:
+            delta = _diff_templates(entry["docs"][0], docs[0]) if entry["docs"] and docs else None
+            deltas = (deltas + [(entry["version"], version, delta)])[-TEMPLATE_DELTA_HISTORY:]
+            _publish_template_change(clan, entry["version"], version, delta, docs[0] if docs else {})
+
+        entry = {
+            "version": version,
+            "docs": docs,
+            "encoded": _encode_payload(docs),
+            "deltas": deltas,
+            "encoded_deltas": {},
+            "checked_at": now,
+            "loaded_at": now,
+        }
+        template_cache[clan] = entry
+        logger.info(f"Loaded '{clan}' template into cache (version {entry['version']}).")
+        return entry
+
+
+def _template_scoring(template_doc: Dict[str, Any]) -> Tuple[Dict[str, tuple], Dict[str, float]]:
+    """
+    What the bot scores players with (its compiled template index): (tier, source,
+    item, points) by "tier.source.item" key, and each source's unlocked multiplier factor.
+    """
+    factors: Dict[str, float] = {}
+    for multiplier in template_doc.get("multipliers", []):
+        if isinstance(multiplier, dict) and multiplier.get("unlocked", False):
+            for source_name in dict.fromkeys(multiplier.get("affects", [])):
+                factors[source_name] = factors.get(source_name, 1.0) * float(multiplier.get("factor", 1.0))
+
+    items: Dict[str, tuple] = {}
+    for tier_name, tier_data in (template_doc.get("tiers") or {}).items():
+        for source_data in tier_data.get("sources", []):
+            source_name = source_data.get("name")
+            for item_data in source_data.get("items", []):
+                if not isinstance(item_data, dict) or not source_name or not item_data.get("name"):
+                    continue
+                try:
+                    points = float(item_data.get("points", 0))
+                except (TypeError, ValueError):
+                    continue
+                # The first match wins, as in the bot.
+                items.setdefault(f"{tier_name}.{source_name}.{item_data['name']}", (tier_name, source_name, item_data["name"], points))
+    return items, factors
+
+
+async def _get_template_scoring(clan: str) -> Tuple[Dict[str, tuple], Dict[str, float]]:
+    """The clan's scoring index, built once per cached template version."""
+    entry = await _get_template_cache_entry(clan)
+    if "scoring" not in entry:
+        entry["scoring"] = _template_scoring(entry["docs"][0] if entry["docs"] else {})
+    return entry["scoring"]
+
+
+def _player_points_breakdown(obtained_items: Dict[str, Any], scoring: Tuple[Dict[str, tuple], Dict[str, float]]) -> Dict[str, Any]:
+    """A player's points per tier, source and item, scored as the bot scores total_gained."""
+    items, factors = scoring
+    total = 0.0
+    by_tier: Dict[str, float] = {}
+    sources: Dict[tuple, Dict[str, Any]] = {}
+    for item_key, count in obtained_items.items():
+        item = items.get(item_key)
+        if item is None or not isinstance(count, int) or count <= 0:
+            continue
+        tier_name, source_name, item_name, points = item
+        factor = factors.get(source_name, 1.0)
+        item_points = count * points * factor
+        source = sources.setdefault((tier_name, source_name), {
+            "tier": tier_name, "source": source_name, "factor": factor, "points": 0.0, "items": [],
+        })
+        source["items"].append({"item": item_name, "count": count, "points": round(item_points, 2)})
+        source["points"] += item_points
+        by_tier[tier_name] = by_tier.get(tier_name, 0.0) + item_points
+        total += item_points
+
+    for source in sources.values():
+        source["points"] = round(source["points"], 2)
+    return {
+        "total": round(total, 2),
+        "by_tier": {tier_name: round(points, 2) for tier_name, points in by_tier.items()},
+        "sources": sorted(sources.values(), key=lambda source: -source["points"]),
+    }
+
+
+def _invalidate_template_cache(clan: str):
+    # Keep the stale entry around so the next load can diff against it.
+    entry = template_cache.get(clan)
+    if entry:
+        entry["checked_at"] = entry["loaded_at"] = float("-inf")
+
+
+async def _template_response(request: Request, clan: str, since: Optional[int]) -> Response:
+    entry = await _get_template_cache_entry(clan)
+    if since is not None:
+        encoded_delta = _template_delta_since(entry, since)
+        if encoded_delta is not None:
+            logger.info(f"Returning '{clan}' template delta {since} -> {entry['version']}.")
+            return _encoded_response(request, encoded_delta)
+        logger.info(f"No '{clan}' template delta available from version {since}. Returning full template.")
+    logger.info(f"Data retrieved (version {entry['version']}).")
+    return _encoded_response(request, entry["encoded"])
 
 
 @app.get("/leaderboards")
-async def get_leaderboard():
-    logger.info("Frontend requested leaderboards. Reading from cache.")
-    if 'combined_leaderboards' in leaderboards_cache:
-        cached_data = leaderboards_cache['combined_leaderboards']
+async def get_leaderboard(request: Request, format: str = Query("rows", pattern="^(rows|columnar)$")):
+    logger.info(f"Frontend requested leaderboards ({format}). Reading from cache.")
+    cache_key = 'combined_leaderboards_columnar_encoded' if format == "columnar" else 'combined_leaderboards_encoded'
+    if cache_key in leaderboards_cache:
         logger.info("Returning cached leaderboard data.")
-        return cached_data
+        return _encoded_response(request, leaderboards_cache[cache_key])
     else:
         logger.warning("Leaderboard data not yet available in cache. Initial fetch might be in progress or failed.")
         raise HTTPException(
@@ -447,72 +1720,340 @@ async def get_leaderboard():
             detail="Leaderboard data not yet available. Please try again shortly. (Initial fetch might be in progress or failed.)"
         )
     
-# --- Existing GET /ironfoundry endpoint (No change) ---
+@app.get("/leaderboards/index")
+async def get_leaderboard_index(request: Request):
+    logger.info("Frontend requested the leaderboard index. Reading from cache.")
+    if 'leaderboard_index_encoded' not in leaderboards_cache:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Leaderboard data not yet available. Please try again shortly."
+        )
+    return _encoded_response(request, leaderboards_cache['leaderboard_index_encoded'])
+
+
+@app.get("/leaderboards/status")
+async def get_leaderboard_status(request: Request):
+    now = time.time()
+    monotonic_now = time.monotonic()
+    return {
+        "coordination": {
+            "mode": REFRESH_COORDINATION,
+            "worker": WORKER_ID,
+            "leader": getattr(request.app.state, "refresh_leader", REFRESH_COORDINATION == "local"),
+        },
+        "Data": [
+            {
+                "source": source["name"],
+                "boards": [board["title"] for board in source["boards"]],
+                "interval": source["interval"],
+                "age_seconds": round(now - source["updated_at"], 1) if source["updated_at"] else None,
+                "error": source["error"],
+                "failures": source["failures"],
+                "latency_ms": wom_metric_latencies_ms.get(source["name"]),
+                "csv": wom_csv_stats.get(source["name"]),
+                "next_refresh_in": round(max(0.0, source["next_refresh_at"] - monotonic_now), 1),
+                "refreshing": source["in_flight"] is not None and not source["in_flight"].done(),
+            }
+            for source in leaderboard_sources.values()
+        ],
+    }
+
+
+def _require_admin(authorization: Optional[str]):
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin token.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@app.post("/leaderboards/{board}/refresh")
+async def refresh_leaderboard_board(request: Request, board: str, authorization: Optional[str] = Header(None)):
+    """Refreshes the source behind one board now instead of waiting for its next cycle."""
+    _require_admin(authorization)
+    source = _find_leaderboard_source(board)
+    if source is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown leaderboard '{board}'.")
+
+    if REFRESH_COORDINATION == "mongo" and not getattr(request.app.state, "refresh_leader", False):
+        await _request_leader_refresh(source["name"])
+        logger.info(f"Admin refresh of '{source['name']}' queued for the refresh leader.")
+        return Response(
+            content=msgspec.json.encode({"source": source["name"], "queued": True}),
+            media_type="application/json",
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+
+    logger.info(f"Admin refresh of '{source['name']}' requested for board '{board}'.")
+    [refreshed] = await _refresh_leaderboard_sources([source])
+    return {
+        "source": source["name"],
+        "refreshed": refreshed,
+        "error": source["error"],
+        "boards": [b["title"] for b in source["boards"]],
+        "next_refresh_in": round(max(0.0, source["next_refresh_at"] - time.monotonic()), 1),
+    }
+
+
+@app.get("/leaderboards/{board}/history")
+async def get_leaderboard_history(
+    board: str,
+    rsn: Optional[str] = None,
+    clan: Optional[str] = None,
+    since: Optional[int] = Query(None, description="Unix seconds, defaults to 7 days ago"),
+    until: Optional[int] = Query(None, description="Unix seconds, defaults to now"),
+    points: int = Query(200, ge=1, le=HISTORY_MAX_POINTS),
+):
+    if (rsn is None) == (clan is None):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Pass exactly one of 'rsn' or 'clan'.")
+
+    until = until if until is not None else int(time.time())
+    since = since if since is not None else until - 7 * 24 * 3600
+    since_day = datetime.datetime.fromtimestamp(since, datetime.timezone.utc).strftime("%Y-%m-%d")
+    until_day = datetime.datetime.fromtimestamp(until, datetime.timezone.utc).strftime("%Y-%m-%d")
+    series, key = ("player", _normalize_rsn(rsn)) if rsn is not None else ("clan", clan)
+
+    buckets = await history_series_coll_async.find(
+        {"board": board, "series": series, "key": key, "day": {"$gte": since_day, "$lte": until_day}},
+        {"_id": 0, "points": 1},
+    ).sort("day", 1).to_list(length=None)
+    history = _downsample_history([point for bucket in buckets for point in bucket["points"]], since, until, points)
+
+    fields = ["ts", "value", "rank"] if series == "player" else ["ts", "value", "players", "best_rank"]
+    return {"board": board, series: rsn if rsn is not None else clan, "since": since, "until": until, "fields": fields, "points": history}
+
+
+@app.get("/leaderboards/{board}")
+async def get_leaderboard_page(
+    request: Request,
+    board: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(LEADERBOARD_PAGE_SIZE, ge=1, le=500),
+    format: str = Query("rows", pattern="^(rows|columnar)$"),
+):
+    logger.info(f"Frontend requested leaderboard '{board}' (offset={offset}, limit={limit}). Reading from cache.")
+    if 'leaderboard_boards' not in leaderboards_cache:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Leaderboard data not yet available. Please try again shortly."
+        )
+
+    cached_board = leaderboards_cache['leaderboard_boards'].get(board)
+    if cached_board is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown leaderboard '{board}'.")
+
+    columnar = format == "columnar"
+    page_number, remainder = divmod(offset, LEADERBOARD_PAGE_SIZE)
+    if not columnar and limit == LEADERBOARD_PAGE_SIZE and remainder == 0 and page_number < len(cached_board["pages"]):
+        return _encoded_response(request, cached_board["pages"][page_number])
+
+    # Slices off the page grid are encoded in the negotiated coding only, and kept for repeat requests.
+    encoding = _negotiate_encoding(request)
+    slice_key = (board, cached_board["etag"], offset, limit, format, encoding)
+    encoded = leaderboard_slice_cache.get(slice_key)
+    if encoded is None:
+        encoded = leaderboard_slice_cache[slice_key] = _encode_payload(
+            _board_page(cached_board, offset, limit, columnar), (encoding,) if encoding else ()
+        )
+    return _encoded_response(request, encoded)
+
+
+@app.get("/players/{rsn}")
+async def get_player_profile(rsn: str):
+    if 'leaderboard_boards' not in leaderboards_cache:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Leaderboard data not yet available. Please try again shortly."
+        )
+
+    key = _normalize_rsn(rsn)
+    standings = []
+    stored_rsn = None
+    display_rsn = None
+    clan = None
+    for slug, board in leaderboards_cache['leaderboard_boards'].items():
+        position = board["positions"].get(key)
+        if position is None:
+            continue
+        value = board["value"][position]
+        standings.append({
+            "board": slug,
+            "title": board["title"],
+            "rank": _board_rank(board, value),
+            "position": position + 1,
+            "value": value,
+            "total": len(board["rsn"]),
+        })
+        clan = clan or LEADERBOARD_CLANS[board["clan"][position]]
+        display_rsn = display_rsn or board["rsn"][position]
+        if slug in MONGO_BOARD_SLUGS:
+            stored_rsn = board["rsn"][position]
+
+    profile = mongo_player_profiles.get(key)
+    if profile is None and stored_rsn is not None and not mongo_player_profiles_complete:
+        # The aggregate pipelines carry no items: look the player up once per board reload.
+        try:
+            doc = await players_coll_async.find_one({"rsn": stored_rsn}, PLAYERS_SCAN_PROJECTION)
+        except Exception as e:
+            logger.error(f"Looking up player '{rsn}' in MongoDB failed: {e}")
+        else:
+            if doc is not None:
+                _set_player_profile(str(doc["_id"]), doc)
+                profile = mongo_player_profiles.get(key)
+
+    if not standings and profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No standings found for '{rsn}'.")
+
+    obtained_items = (profile or {}).get("obtained_items") or {}
+    items_by_tier: Dict[str, int] = {}
+    for item_key, count in obtained_items.items():
+        if isinstance(count, (int, float)):
+            tier = item_key.split(".", 1)[0]
+            items_by_tier[tier] = items_by_tier.get(tier, 0) + int(count)
+
+    clan = (profile or {}).get("clan") or clan
+    points = None
+    if clan in template_colls_async and obtained_items:
+        try:
+            points = _player_points_breakdown(obtained_items, await _get_template_scoring(clan))
+        except Exception as e:
+            logger.error(f"Loading the '{clan}' template to score '{rsn}' failed: {e}")
+
+    return {
+        "rsn": (profile or {}).get("rsn") or display_rsn,
+        "clan": clan,
+        "total_gained": (profile or {}).get("total_gained"),
+        "items_by_tier": items_by_tier,
+        "points": points,
+        "boards": standings,
+    }
+
+
+@app.get("/standings")
+async def get_standings(request: Request):
+    """Per-team totals, averages and top contributors for every WOM metric the refresh fetches."""
+    logger.info("Frontend requested team standings. Reading from cache.")
+    if 'standings_encoded' not in leaderboards_cache:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Standings not yet available. Please try again shortly."
+        )
+    return _encoded_response(request, leaderboards_cache['standings_encoded'])
+
+
 @app.get("/ironfoundry")
-async def get_if_data() -> List[Dict]:
+async def get_if_data(request: Request, since: Optional[int] = None):
     logger.info("Retrieving data from the first collection")
-    event_data = list(if_coll.find({}))
-    logger.info(f"Data retrieved.")
-    return event_data
+    return await _template_response(request, "ironfoundry", since)
+
 
-# --- Existing GET /ironclad endpoint (No change) ---
 @app.get("/ironclad")
-async def get_ic_data() -> List[Dict]:
+async def get_ic_data(request: Request, since: Optional[int] = None):
     logger.info("Retrieving data from the second collection")
-    event_data = list(ic_coll.find({}))
-    logger.info(f"Data retrieved.")
-    return event_data # type: ignore
+    return await _template_response(request, "ironclad", since)
+
+
+@app.get("/live")
+async def live_standings(request: Request):
+    """
+    Server-sent events: "leaderboard" rank/points changes, "template" deltas
+    (same shape as ?since=), "multiplier" unlocks, and "resync" when the
+    client missed more than the buffer holds.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    last_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    logger.info(f"Live client connected ({live_broadcaster.listeners + 1} watching).")
+    return StreamingResponse(
+        live_broadcaster.stream(last_seq),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+MILESTONE_CATEGORY_PATTERN = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+def _milestone_update_ops(clan: str, clan_data: Any) -> List[UpdateOne]:
+    """
+    One UpdateOne per category, each setting every listed metric through its own
+    arrayFilter and bumping the template version. An op only matches while the
+    category exists and one of its metrics holds a different value, so unknown
+    categories and unchanged values write nothing and leave the version alone.
+    """
+    if not isinstance(clan_data, dict):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"'{clan}' must map categories to metrics.")
+
+    ops: List[UpdateOne] = []
+    for category, metrics in clan_data.items():
+        if not MILESTONE_CATEGORY_PATTERN.match(category) or not isinstance(metrics, dict):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Invalid milestone category '{category}' for '{clan}'.")
+        if not metrics:
+            continue
+
+        set_fields: Dict[str, Any] = {}
+        array_filters: List[Dict[str, Any]] = []
+        changed: List[Dict[str, Any]] = []
+        for i, (metric_name, value) in enumerate(metrics.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Milestone '{category}.{metric_name}' for '{clan}' must be numeric.")
+            set_fields[f"milestones.{category}.$[m{i}].current_value"] = value
+            array_filters.append({f"m{i}.name": metric_name})
+            changed.append({f"milestones.{category}": {"$elemMatch": {"name": metric_name, "current_value": {"$ne": value}}}})
+
+        ops.append(UpdateOne(
+            {f"milestones.{category}": {"$exists": True}, "$or": changed},
+            {"$set": set_fields, "$inc": {"version": 1}},
+            array_filters=array_filters,
+        ))
+    return ops
+
+
+async def _apply_milestone_updates(milestone_data: Dict[str, Any]) -> Dict[str, Any]:
+    unknown = set(milestone_data) - set(template_colls_async)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Unknown clan(s): {', '.join(sorted(unknown))}.")
+
+    ops_by_clan = {clan: _milestone_update_ops(clan, clan_data) for clan, clan_data in milestone_data.items()}
+    ops_by_clan = {clan: ops for clan, ops in ops_by_clan.items() if ops}
+
+    async def write_clan(clan: str, ops: List[UpdateOne]) -> Dict[str, Any]:
+        try:
+            result = await template_colls_async[clan].bulk_write(ops, ordered=False)
+        finally:
+            # A partially applied batch (BulkWriteError) has changed the template too.
+            _invalidate_template_cache(clan)
+        logger.info(f"{clan} milestone bulk_write: {len(ops)} op(s), matched: {result.matched_count}, modified: {result.modified_count}")
+        return {"operations": len(ops), "matched": result.matched_count, "modified": result.modified_count}
 
-# --- Existing POST /milestones endpoint (No change) ---
-@app.post("/milestones")
-async def update_milestones(milestone_data: Dict):
-    logger.info(milestone_data)
+    results = await asyncio.gather(*(write_clan(clan, ops) for clan, ops in ops_by_clan.items()))
+    return dict(zip(ops_by_clan, results))
 
-    try:
-        ironfoundry_data = milestone_data.get("ironfoundry")
-        if ironfoundry_data:
-            category = list(ironfoundry_data.keys())[0]
-            metric_name = list(ironfoundry_data[category].keys())[0]
-            updated_value = ironfoundry_data[category][metric_name]
-
-            logger.info(f"Updating Iron Foundry: Category='{category}', Metric='{metric_name}', Value={updated_value}")
-
-            ironfoundry_template = if_coll.find_one({}) # type: ignore
-            if ironfoundry_template:
-                update_result = if_coll.update_one(
-                    {"_id": ironfoundry_template["_id"], f"milestones.{category}.name": metric_name},
-                    {"$set": {f"milestones.{category}.$.current_value": updated_value}}
-                ) # type: ignore
-                logger.info(f"Iron Foundry update_one acknowledged: {update_result.acknowledged}, matched: {update_result.matched_count}, modified: {update_result.modified_count}")
-            else:
-                 logger.warning("Iron Foundry template document not found or missing _id for update.")
-
-        ironclad_data = milestone_data.get("ironclad")
-        if ironclad_data:
-            category = list(ironclad_data.keys())[0]
-            metric_name = list(ironclad_data[category].keys())[0]
-            updated_value = ironclad_data[category][metric_name]
-
-            logger.info(f"Updating Ironclad: Category='{category}', Metric='{metric_name}', Value={updated_value}")
-
-            ironclad_template = ic_coll.find_one({}) # type: ignore
-            if ironclad_template and '_id' in ironclad_template:
-                 update_result = ic_coll.update_one(
-                    {"_id": ironclad_template["_id"], f"milestones.{category}.name": metric_name},
-                    {"$set": {f"milestones.{category}.$.current_value": updated_value}}
-                ) # type: ignore
-                 logger.info(f"Ironclad update_one acknowledged: {update_result.acknowledged}, matched: {update_result.matched_count}, modified: {update_result.modified_count}")
-            else:
-                 logger.warning("Ironclad template document not found or missing _id for update.")
-
-        return {"message": "Milestone data processed for update."}
 
+@app.post("/milestones/batch")
+async def update_milestones_batch(milestone_data: Dict[str, Any]):
+    metric_count = sum(len(metrics) for clan_data in milestone_data.values() if isinstance(clan_data, dict) for metrics in clan_data.values() if isinstance(metrics, dict))
+    logger.info(f"Received milestone batch with {metric_count} metric value(s) for {', '.join(milestone_data) or 'no clans'}.")
+
+    try:
+        results = await _apply_milestone_updates(milestone_data)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"An unhandled error occurred during milestone update processing: {e}", exc_info=True)
-        return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error") # Use status constant
+        logger.error(f"An unhandled error occurred during milestone batch processing: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error")
+
+    return {"message": "Milestone data processed for update.", "results": results}
+
+
+@app.post("/milestones")
+async def update_milestones(milestone_data: Dict[str, Any]):
+    # Single-metric payloads are just a batch of one; kept for older updaters.
+    return await update_milestones_batch(milestone_data)
 
 
 if __name__ == "__main__":
     import uvicorn
-    import datetime # type: ignore
     uvicorn.run(app, host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+Benchmarks building the Mongo-backed leaderboards in "scan" mode (one projected
+Players pass scored in Python) against "aggregate" mode (one server-side
+pipeline per board), on synthetic players.
+
+By default no mongod is needed: both modes read BSON-encoded results from
+in-memory cursors, so this measures the bytes that would cross the wire and the
+client's decode + build time. The server's own pipeline cost is not included.
+
+With --mongo-uri (or MONGO_BENCH_URI) the players are also inserted into a
+throwaway database on that mongod and both modes are timed end to end against
+it, $group/$sort pipelines included. Skipped when no mongod answers there.
+
+    python backend/bench/mongo_boards.py --players 100000
+    python backend/bench/mongo_boards.py --players 100000 --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+import bson
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:1")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from loguru import logger
+
+import app
+
+
+class _Cursor:
+    def __init__(self, encoded_docs):
+        self.encoded_docs = encoded_docs
+
+    async def __aiter__(self):
+        for encoded in self.encoded_docs:
+            yield bson.decode(encoded)
+
+
+class _ScanCollection:
+    def __init__(self, encoded_docs):
+        self.encoded_docs = encoded_docs
+
+    def find(self, *args, **kwargs):
+        return _Cursor(self.encoded_docs)
+
+
+class _AggregateCollection:
+    def __init__(self, encoded_results):
+        self.encoded_results = encoded_results
+        self.calls = 0
+
+    async def aggregate(self, pipeline, **kwargs):
+        board = app.MONGO_LEADERBOARDS[self.calls % len(app.MONGO_LEADERBOARDS)]
+        self.calls += 1
+        return _Cursor(self.encoded_results[board["title"]])
+
+
+def synth_players(count: int, seed: int = 1):
+    rnd = random.Random(seed)
+    keys = [f"Tier{t}.Source{s}.Item{i}" for t in range(5) for s in range(10) for i in range(6)]
+    keys += [f"Miscellaneous.Pets.Pet{i}" for i in range(30)]
+    players = []
+    for i in range(count):
+        players.append({
+            "_id": i,
+            "rsn": f"player {i}",
+            "clan": rnd.choice(["ironfoundry", "ironclad"]),
+            "total_gained": round(rnd.random() * 1000, 2),
+            "obtained_items": {key: rnd.randint(1, 3) for key in rnd.sample(keys, rnd.randint(0, 25))},
+            "submissions": [{"item": "x", "status": "accepted"}] * 5,
+        })
+    return players
+
+
+async def bench_mongod(uri: str, players, runs: int):
+    """Times both modes against a real mongod; returns None when none answers at uri."""
+    from pymongo import AsyncMongoClient
+    from pymongo.errors import PyMongoError
+
+    client = AsyncMongoClient(uri, serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as e:
+        await client.close()
+        print(f"mongod: skipped, none reachable at {uri} ({type(e).__name__})")
+        return None
+    database = client[f"mongo_boards_bench_{uuid.uuid4().hex}"]
+    try:
+        for start in range(0, len(players), 10_000):
+            await database["Players"].insert_many(players[start:start + 10_000], ordered=False)
+        app.players_coll_async = database["Players"]
+        timings = {}
+        for mode, helper in (("scan", app._get_mongo_leaderboards_data_helper), ("aggregate", app._get_mongo_leaderboards_aggregate_helper)):
+            seconds = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                boards = await helper()
+                seconds.append(time.perf_counter() - started)
+            timings[mode] = (min(seconds), boards)
+        return timings
+    finally:
+        await client.drop_database(database.name)
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_BENCH_URI"), help="also time both modes against this mongod")
+    parser.add_argument("--runs", type=int, default=3, help="mongod runs per mode; the fastest is reported")
+    args = parser.parse_args()
+    logger.remove()
+
+    players = synth_players(args.players)
+    scan_wire = [bson.encode({k: v for k, v in doc.items() if k in app.PLAYERS_SCAN_PROJECTION}) for doc in players]
+    # What each board's pipeline returns, computed with the Python value functions.
+    aggregate_wire = {}
+    for board in app.MONGO_LEADERBOARDS:
+        results = [(board["value"](doc), doc) for doc in players]
+        results = sorted((r for r in results if r[0] is not None), key=lambda r: (-r[0], r[1]["_id"]))
+        aggregate_wire[board["title"]] = [
+            bson.encode({"_id": doc["_id"], "rsn": doc["rsn"], "clan": doc["clan"], "value": value}) for value, doc in results
+        ]
+
+    app.players_coll_async = _ScanCollection(scan_wire)
+    started = time.perf_counter()
+    scan_boards = asyncio.run(app._get_mongo_leaderboards_data_helper())
+    scan_seconds = time.perf_counter() - started
+
+    app.players_coll_async = _AggregateCollection(aggregate_wire)
+    started = time.perf_counter()
+    aggregate_boards = asyncio.run(app._get_mongo_leaderboards_aggregate_helper())
+    aggregate_seconds = time.perf_counter() - started
+
+    full_bytes = sum(len(bson.encode(doc)) for doc in players)
+    scan_bytes = sum(map(len, scan_wire))
+    aggregate_bytes = sum(len(encoded) for results in aggregate_wire.values() for encoded in results)
+    print(f"players: {args.players}, full documents {full_bytes / 1e6:.1f} MB")
+    print(f"wire:  scan {scan_bytes / 1e6:.1f} MB, aggregate {aggregate_bytes / 1e6:.1f} MB")
+    print(f"decode + build: scan {scan_seconds:.2f} s, aggregate {aggregate_seconds:.2f} s")
+    print(f"boards identical: {scan_boards == aggregate_boards}")
+
+    if args.mongo_uri:
+        timings = asyncio.run(bench_mongod(args.mongo_uri, players, args.runs))
+        if timings:
+            (scan_seconds, scan_boards), (aggregate_seconds, aggregate_boards) = timings["scan"], timings["aggregate"]
+            print(f"mongod end to end: scan {scan_seconds:.2f} s, aggregate {aggregate_seconds:.2f} s (best of {args.runs})")
+            print(f"boards identical: {scan_boards == aggregate_boards}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmarks turning WOM competition CSVs into boards: cold 'import app' time,
+CPU per refresh for every metric and peak traced allocation. When pandas is
+installed, the former pandas read_csv path is measured alongside for
+comparison.
+
+    python backend/bench/wom_csv.py --rows 3000
+"""
+import argparse
+import io
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:1")
+sys.path.insert(0, BACKEND_DIR)
+
+from loguru import logger
+
+import app
+
+
+def make_csv(rows: int) -> str:
+    lines = ["Rank,Username,Team,Start,End,Gained,Last Updated"]
+    for i in range(rows):
+        lines.append(f"{i + 1},player {i},{'Iron Foundry' if i % 2 else 'Ironclad'},0,{i},{(i * 37) % 1000},2025-05-24")
+    return "\n".join(lines)
+
+
+def csv_refresh(csvs):
+    return [app._build_wom_leaderboard(metric, app._parse_wom_csv(content)) for metric, content in csvs]
+
+
+def pandas_refresh(csvs, pd):
+    # The pre-csv-module path: read_csv, coerce Gained, sort and walk the rows.
+    boards = []
+    for metric, content in csvs:
+        df = pd.read_csv(io.StringIO(content))
+        df["Gained"] = pd.to_numeric(df["Gained"], errors="coerce").fillna(0).astype(float)
+        rows = [(row.Username, row.Gained, row.Team) for row in df.sort_values(by="Gained", ascending=False).itertuples(index=False)]
+        boards.append(rows)
+    return boards
+
+
+def cpu_ms(refresh, repeat: int) -> float:
+    refresh()
+    started = time.process_time()
+    for _ in range(repeat):
+        refresh()
+    return (time.process_time() - started) / repeat * 1000
+
+
+def peak_mb(refresh) -> float:
+    tracemalloc.start()
+    refresh()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def cold_import_ms(runs: int = 5) -> float:
+    code = f"import sys, time; sys.path.insert(0, {BACKEND_DIR!r}); t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+    times = sorted(
+        float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=os.environ).stdout.split()[-1])
+        for _ in range(runs)
+    )
+    return times[runs // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    logger.remove()
+
+    csvs = [(metric, make_csv(args.rows)) for metric in app.WOM_METRICS]
+    print(f"cold 'import app': {cold_import_ms():.0f} ms (median of 5)")
+    print(f"csv module, {len(csvs)} boards x {args.rows} rows: {cpu_ms(lambda: csv_refresh(csvs), args.repeat):.0f} ms CPU per refresh, "
+          f"peak {peak_mb(lambda: csv_refresh(csvs)):.1f} MB")
+
+    try:
+        import pandas as pd
+    except ImportError:
+        print("pandas not installed; skipping the pandas comparison")
+        return
+    print(f"pandas,     {len(csvs)} boards x {args.rows} rows: {cpu_ms(lambda: pandas_refresh(csvs, pd), args.repeat):.0f} ms CPU per refresh, "
+          f"peak {peak_mb(lambda: pandas_refresh(csvs, pd)):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -134,7 +134,7 @@ async def populate_verify_set():
 async def update_db(discord_id: int, rsn: str):
     await players.update_one(
         {"discord_id": discord_id},
-        {"$set": {"rsn": rsn.lower()}},
+        {"$set": {"rsn": rsn.lower(), "updated_at": discord.utils.utcnow()}},
         upsert=True
     )
     logger.info(f"Database updated for Discord ID {discord_id} with RSN: {rsn.lower()}")
@@ -330,6 +330,7 @@ async def update_player_clans(interaction: discord.Interaction):
                 current_clan_in_db = player_document.get("clan")
                 if current_clan_in_db != member_clan:
                     player_document["clan"] = member_clan # Update the clan field
+                    player_document["updated_at"] = discord.utils.utcnow()
                     update_result = await players.replace_one({"_id": player_document["_id"]}, player_document)
                     if update_result.modified_count > 0:
                         updated_count += 1
@@ -350,7 +351,8 @@ async def update_player_clans(interaction: discord.Interaction):
                         "clan": member_clan, # Set the determined clan
                         "screenshots": [], # Or remove if not needed at this level
                         "total_gained": 0.0,
-                        "obtained_items": {} # Initialize obtained items structure
+                        "obtained_items": {}, # Initialize obtained items structure
+                        "updated_at": discord.utils.utcnow()
                     }
                     insert_result = await players.insert_one(new_player_document)
                     if insert_result.inserted_id:
@@ -379,6 +381,22 @@ async def update_player_clans(interaction: discord.Interaction):
     await interaction.followup.send(summary_message)
     logger.info(f"Update player clans command finished. Updated: {updated_count}, Created: {created_count}, Errors: {errors_count}.")
     
+@group.command(name="recalculate_points", description="Recalculates every player's points from the current templates.")
+async def recalculate_points(interaction: discord.Interaction):
+    logger.info(f"Recalculate points command initiated by {interaction.user.id} ({interaction.user.name}).")
+    await interaction.response.defer(thinking=True)
+
+    from .submit import recalculate_all_player_points
+    stats = await recalculate_all_player_points()
+
+    summary_message = "Finished recalculating player points.\n"
+    summary_message += f"Checked {stats['checked']} players, updated {stats['updated']} in {stats['seconds']:.2f}s "
+    summary_message += f"({stats['batches']} batches, max {stats['max_batch_seconds'] * 1000:.0f} ms).\n"
+    if stats["errors"] > 0:
+        summary_message += f"Encountered {stats['errors']} errors."
+
+    await interaction.followup.send(summary_message)
+
 @group.command(name="pet_tally", description="Shows pet statistics for each team.")
 async def pet_tally(interaction: discord.Interaction):
     logger.info(f"Received /pet_tally from {interaction.user.id} ({interaction.user.name})")
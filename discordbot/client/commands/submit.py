@@ -1,18 +1,33 @@
 from decimal import DivisionByZero
+import asyncio
+import copy
 import math
+import os
+import random
+import time
 from typing import Any, Dict, List, Literal, Optional, Tuple
 import discord
 
 from loguru import logger
 from dotenv import load_dotenv
 from discord import Embed, app_commands
-from pymongo import AsyncMongoClient
+from pymongo import AsyncMongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from pymongo.asynchronous.collection import AsyncCollection
 from pymongo.asynchronous.database import AsyncDatabase
-from cachetools import TTLCache
+from cachetools import LRUCache, TTLCache
 
 
 from ..modules.activity_modals import ACTIVITY_MODAL_MAP, get_activity_modal_class, upload_screenshot
+from ..modules.template_index import (
+    CompiledTemplate,
+    TemplateSource,
+    cache_compiled_template,
+    compile_template,
+    get_compiled_template,
+    recompile_sources,
+    template_version,
+)
 
 
 load_dotenv()
@@ -21,40 +36,24 @@ IF_roleid = 1343921101687750716
 ICPERM = [1369428787342737488, 1369428819907448832]
 IFPERM = [1369428706161852436, 1369428754773840082]
 autocomplete_cache = TTLCache(maxsize=512, ttl=30)
+# The full player points sweep runs on this schedule (0 disables it) and from /dev recalculate_points;
+# accepting a submission only recalculates the players it can affect.
+PLAYER_RECALCULATE_INTERVAL_MINUTES = float(os.getenv("PLAYER_RECALCULATE_INTERVAL_MINUTES", "60"))
+PLAYER_RECALCULATE_BATCH_SIZE = max(1, int(os.getenv("PLAYER_RECALCULATE_BATCH_SIZE", "500")))
+PLAYER_POINTS_PROJECTION = {"_id": 1, "discord_id": 1, "clan": 1, "total_gained": 1, "total_gained_version": 1, "obtained_items": 1}
+player_recalculate_task: Optional[asyncio.Task] = None
+# An accept saves the template only if no other accept saved it since it was loaded; otherwise it
+# reloads and retries, up to this many times, after a jittered backoff doubling from the base delay.
+ACCEPT_SAVE_ATTEMPTS = 8
+ACCEPT_RETRY_BASE_SECONDS = 0.02
+# (template _id, version) -> (per-source points aligned with the compiled sources, total) this bot saved with that version
+template_scores = LRUCache(maxsize=8)
 db = Optional[AsyncDatabase]
 if_coll = Optional
 ic_coll = Optional
 template_coll = Optional
 player_coll = Optional
 
-SPECIAL_FRENZY_MULTIPLIER_NAMES = {
-    "Banana Split",
-    "Demon Slayer II",
-    "Oscar Worthy",
-    "How to Smelt Your Dragon",
-    "Raining Blood",
-    "The Zarosian Candidate",
-    "Rock Solid",
-    "Shape of Italy",
-    "Mystic Pizza",
-    "Eye of the Beholder",
-    "Lord of Bones",
-    "Man Purse",
-    "Gonna Need a Bigger Boat",
-    "Kitchen Nightmares",
-    "Rogue One",
-    "Throwing Shade",
-    "Get to the Chompa!",
-    "Return the Slab",
-    "Deadliest Catch",
-    "What's in the Box?!",
-    "Rag and Bone Man III",
-    "Agent of Chaos",
-    "The Blade that was Broken",
-    "Tzhaar Wars",
-    "CANNONBALL!"
-}
-
 
 IMAGE_UPLOAD_CHOICES = [
     app_commands.Choice(name="Hunter's Guild", value="Hunter's Guild"),
@@ -189,19 +188,14 @@ async def _template_find_helper(template_doc: Dict[str, Any], tier_name: str, so
     """Finds an item's data within a loaded template document."""
     if not template_doc:
         return None
-    tiers = template_doc.get("tiers", {})
-    tier_data = tiers.get(tier_name)
-    if not tier_data:
+    item = get_compiled_template(template_doc).items.get(f"{tier_name}.{source_name}.{item_name}")
+    if item is None:
         return None
-    sources = tier_data.get("sources", [])
-    for source_data in sources:
-        if source_data.get("name") == source_name:
-            items = source_data.get("items", [])
-            for item_data in items:
-                if item_data.get("name") == item_name:
-                    # Return a dictionary containing the item, its source, and its tier for context
-                    return {"item": item_data, "source": source_data, "tier": tier_data, "tier_name": tier_name}
-    return None
+    # The compiled index holds positions, so the dicts returned belong to this document and can be edited in place.
+    tier_data = template_doc["tiers"][tier_name]
+    source_data = tier_data["sources"][item.source_index]
+    # Return a dictionary containing the item, its source, and its tier for context
+    return {"item": source_data["items"][item.item_index], "source": source_data, "tier": tier_data, "tier_name": tier_name}
 
 
 async def _template_unlock_multi(template_doc: Dict[str, Any], template_doc_before_submission: Dict[str, Any]):
@@ -257,19 +251,57 @@ async def _template_unlock_multi(template_doc: Dict[str, Any], template_doc_befo
 
     return newly_unlocked_multipliers
 
-def _player_calculate_helper(item_data: Dict[str, Any]) -> float:
+def _template_score_fields(template_doc: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[Tuple[str, str], Any]]:
     """
-    Calculates points for an item by awarding its base_points for EACH instance obtained.
-    Ignores unique/duplicate thresholds; assumes base_points is per-instance.
+    The stored scores and unlock flags an accept can change: totals and flags by
+    update path, and each source's 'source_gained' by (tier name, source name).
     """
-    total_item_points = 0.0
-    current_obtained = int(item_data.get("obtained", 0))
-    base_points = float(item_data.get("points", 0))
-
-    # Points are awarded for each instance obtained
-    total_item_points = current_obtained * base_points
-
-    return total_item_points
+    fields: Dict[str, Any] = {"total_gained": template_doc.get("total_gained")}
+    source_fields: Dict[Tuple[str, str], Any] = {}
+    for t_name, t_data in template_doc.get("tiers", {}).items():
+        if not isinstance(t_data, dict):
+            continue
+        fields[f"tiers.{t_name}.points_gained"] = t_data.get("points_gained")
+        t_sources = t_data.get("sources", [])
+        if isinstance(t_sources, list):
+            for s_data in t_sources:
+                if isinstance(s_data, dict) and s_data.get("name"):
+                    source_fields.setdefault((t_name, s_data["name"]), s_data.get("source_gained"))
+    for i, multiplier in enumerate(template_doc.get("multipliers", [])):
+        if isinstance(multiplier, dict):
+            fields[f"multipliers.{i}.unlocked"] = multiplier.get("unlocked", False)
+    return fields, source_fields
+
+def _template_accept_update(template_doc: Dict[str, Any], stored_fields: Tuple[Dict[str, Any], Dict[Tuple[str, str], Any]], tier_name: str, source_name: str, item_name: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    The update (and its arrayFilters) saving one accepted item: $inc of the item's
+    'obtained' and the version, and $set of only the scores and unlocks that
+    differ from stored_fields. Sources are addressed by name, never by position.
+    """
+    fields_before, sources_before = stored_fields
+    fields_after, sources_after = _template_score_fields(template_doc)
+
+    # Compared with their types too: a stored 0 rescored to 0.0 is rewritten as the whole-document save did.
+    changed = lambda before, after: type(before) is not type(after) or before != after
+    set_fields = {path: value for path, value in fields_after.items() if changed(fields_before.get(path), value)}
+    array_filters: List[Dict[str, Any]] = [{"source.name": source_name}, {"item.name": item_name}]
+    for (t_name, s_name), value in sources_after.items():
+        if not changed(sources_before.get((t_name, s_name)), value):
+            continue
+        if (t_name, s_name) == (tier_name, source_name):
+            identifier = "source"
+        else:
+            identifier = f"source{len(array_filters)}"
+            array_filters.append({f"{identifier}.name": s_name})
+        set_fields[f"tiers.{t_name}.sources.$[{identifier}].source_gained"] = value
+
+    template_update: Dict[str, Any] = {"$inc": {
+        f"tiers.{tier_name}.sources.$[source].items.$[item].obtained": 1,
+        "version": 1,
+    }}
+    if set_fields:
+        template_update["$set"] = set_fields
+    return template_update, array_filters
 
 def _template_calculate_helper(item_data: Dict[str, Any]) -> float:
     """
@@ -332,6 +364,220 @@ def does_multiplier_affect_source(multiplier_data: Dict[str, Any], source_name:
     return source_name in affected_sources
 
 
+def _player_total_update(player_document: Dict[str, Any], total_gained: float, template_doc: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Filter and update setting a recalculated total_gained. The write applies only
+    while the player's obtained_items are still those the total was computed
+    from, and no total from a newer template version has been stored since
+    ("total_gained_version"), so a slower writer never replaces a fresher total.
+    """
+    update_filter = {"_id": player_document["_id"], "obtained_items": player_document.get("obtained_items")}
+    fields = {"total_gained": total_gained, "updated_at": discord.utils.utcnow()}
+    version = template_doc.get("version")
+    if version is not None:
+        update_filter["total_gained_version"] = {"$not": {"$gt": version}}
+        fields["total_gained_version"] = version
+    return update_filter, {"$set": fields}
+
+
+async def _player_calulate_from_items(
+    player_document: Dict[str, Any],
+    template_document: Dict[str, Any]
+) -> float:
+    """
+    Calculates a player's total points based on their obtained items,
+    applying applicable UNLOCKED clan multipliers and source-based multipliers.
+
+    Args:
+        player_document: The player's document from the database.
+        template_document: The clan's template document from the database.
+
+    Returns:
+        The calculated total points for the player.
+    """
+    if not player_document or not template_document:
+        logger.error("Player or template document is missing for player total points calculation.")
+        return 0.0
+
+    player_total_points = 0.0
+    player_clan = player_document.get("clan")
+    player_obtained_items = player_document.get("obtained_items", {})
+    compiled = get_compiled_template(template_document)
+
+    for item_key, obtained_count_player in player_obtained_items.items():
+        if not isinstance(item_key, str) or not isinstance(obtained_count_player, int) or obtained_count_player <= 0:
+            logger.warning(f"Malformed obtained_item entry for player {player_document.get('discord_id')}: {item_key}: {obtained_count_player}. Skipping.")
+            continue
+
+        if item_key.count('.') != 2:
+            logger.warning(f"Invalid item_key format '{item_key}' for player {player_document.get('discord_id')}. Skipping.")
+            continue
+
+        item = compiled.items.get(item_key)
+        if item is None:
+            logger.warning(f"Item template data not found for item key '{item_key}' in template for clan '{player_clan}'. Skipping.")
+            continue
+
+        # Base points are awarded for each instance obtained.
+        item_base_contribution = obtained_count_player * item.points
+        item_total_contribution = item_base_contribution * compiled.source_factors.get(item.source_name, 1.0)
+
+        player_total_points += item_total_contribution
+
+    return player_total_points
+
+
+async def _flush_player_updates(updates: List[UpdateOne], stats: Dict[str, Any]):
+    """Sends one unordered bulk_write of player updates and records its latency and outcome."""
+    started = time.perf_counter()
+    try:
+        result = await player_coll.bulk_write(updates, ordered=False)
+        stats["updated"] += result.modified_count
+    except BulkWriteError as e:
+        # Unordered: every operation without a write error was still applied.
+        stats["updated"] += e.details.get("nModified", 0)
+        stats["errors"] += len(e.details.get("writeErrors", []))
+        logger.error(f"Bulk player points update had {len(e.details.get('writeErrors', []))} write errors: {e.details.get('writeErrors', [])[:3]}")
+    except Exception as e:
+        stats["errors"] += len(updates)
+        logger.error(f"Bulk player points update of {len(updates)} players failed: {e}", exc_info=True)
+    latency = time.perf_counter() - started
+    stats["batches"] += 1
+    stats["max_batch_seconds"] = max(stats["max_batch_seconds"], latency)
+    stats["batch_seconds"] += latency
+
+
+async def recalculate_all_player_points(batch_size: int = PLAYER_RECALCULATE_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Recalculates the total_gained points for ALL players in the database
+    based on their obtained_items and the latest UNLOCKED clan multipliers.
+    Changed totals are written as $set updates, flushed with unordered
+    bulk_write in batches of batch_size.
+
+    Runs on a schedule and as an admin command; accepting a submission only
+    recalculates the players it affects.
+    """
+    logger.info("Starting recalculation of all player points and database update.")
+    stats = {"checked": 0, "updated": 0, "errors": 0, "batches": 0, "seconds": 0.0, "batch_seconds": 0.0, "max_batch_seconds": 0.0}
+    started = time.perf_counter()
+
+    template_docs = {}
+    try:
+        if_template_doc = await if_coll.find_one({})
+        if if_template_doc:
+            template_docs["ironfoundry"] = if_template_doc
+        else:
+            logger.warning("Ironfoundry template document not found.")
+
+        ic_template_doc = await ic_coll.find_one({})
+        if ic_template_doc:
+            template_docs["ironclad"] = ic_template_doc
+        else:
+            logger.warning("Ironclad template document not found.")
+
+    except Exception as e:
+        logger.error(f"Error fetching template documents for global recalculation: {e}", exc_info=True)
+        return stats
+
+    if not template_docs:
+        logger.warning("No template documents loaded. Skipping global player points recalculation.")
+        return stats
+
+    updates: List[UpdateOne] = []
+    async for player_doc in player_coll.find({}, PLAYER_POINTS_PROJECTION):
+        stats["checked"] += 1
+        player_id = player_doc.get("_id")
+        discord_id = player_doc.get("discord_id")
+        player_clan = player_doc.get("clan")
+
+        if not player_clan or player_clan not in template_docs:
+            logger.warning(f"Player {discord_id} has invalid/unknown clan '{player_clan}'. Skipping point recalculation for this player.")
+            stats["errors"] += 1
+            continue
+
+        current_template = template_docs[player_clan]
+
+        try:
+            new_player_total_gained = round(await _player_calulate_from_items(player_doc, current_template), 2)
+            old_player_total_gained = float(player_doc.get("total_gained") or 0.0)
+
+            if new_player_total_gained != old_player_total_gained:
+                updates.append(UpdateOne(*_player_total_update(player_doc, new_player_total_gained, current_template)))
+                if len(updates) >= batch_size:
+                    await _flush_player_updates(updates, stats)
+                    updates = []
+
+        except Exception as e:
+            logger.error(f"Error recalculating points for player {discord_id} ({player_id}): {e}", exc_info=True)
+            stats["errors"] += 1
+
+    if updates:
+        await _flush_player_updates(updates, stats)
+
+    stats["seconds"] = time.perf_counter() - started
+    logger.info(
+        f"Players checked: {stats['checked']}, Players updated: {stats['updated']}, Errors: {stats['errors']} "
+        f"in {stats['seconds']:.2f}s ({stats['checked'] / max(stats['seconds'], 1e-9):.0f} players/s); "
+        f"{stats['batches']} batches of up to {batch_size}, "
+        f"mean {stats['batch_seconds'] / max(stats['batches'], 1) * 1000:.1f} ms, max {stats['max_batch_seconds'] * 1000:.1f} ms"
+    )
+    return stats
+
+
+async def _player_recalculate_sources(clan: str, template_doc: Dict[str, Any], source_names: set, skip_player_id: Any = None) -> int:
+    """
+    Recalculates total_gained for only the clan's players holding an item from
+    one of source_names, i.e. the players whose points a multiplier change can
+    move. Returns the number of players updated. Runs inside the accept
+    handler, so database errors are logged and left to the scheduled sweep.
+    """
+    item_keys = [item.key for item in get_compiled_template(template_doc).items.values() if item.source_name in source_names]
+    if not item_keys:
+        return 0
+
+    stats = {"checked": 0, "updated": 0, "errors": 0, "batches": 0, "batch_seconds": 0.0, "max_batch_seconds": 0.0}
+    updates: List[UpdateOne] = []
+    try:
+        # obtained_items keys contain dots, so they are matched as data rather than as field paths.
+        players_cursor = player_coll.find(
+            {
+                "clan": clan,
+                "_id": {"$ne": skip_player_id},
+                "$expr": {"$anyElementTrue": [{"$map": {
+                    "input": {"$objectToArray": {"$ifNull": ["$obtained_items", {}]}},
+                    "as": "item",
+                    "in": {"$in": ["$$item.k", item_keys]},
+                }}]},
+            },
+            PLAYER_POINTS_PROJECTION,
+        )
+        async for player_doc in players_cursor:
+            stats["checked"] += 1
+            new_player_total_gained = round(await _player_calulate_from_items(player_doc, template_doc), 2)
+            if new_player_total_gained != float(player_doc.get("total_gained") or 0.0):
+                updates.append(UpdateOne(*_player_total_update(player_doc, new_player_total_gained, template_doc)))
+    except PyMongoError as e:
+        stats["errors"] += 1
+        logger.error(f"Error reading players holding items from {', '.join(sorted(source_names))}: {e}", exc_info=True)
+
+    if updates:
+        await _flush_player_updates(updates, stats)
+    logger.info(
+        f"Recalculated players holding items from {', '.join(sorted(source_names))}: "
+        f"checked {stats['checked']}, updated {stats['updated']}, errors {stats['errors']}."
+    )
+    return stats["updated"]
+
+
+async def _player_recalculate_loop():
+    while True:
+        await asyncio.sleep(PLAYER_RECALCULATE_INTERVAL_MINUTES * 60)
+        try:
+            await recalculate_all_player_points()
+        except Exception as e:
+            logger.error(f"Scheduled player points recalculation failed: {e}", exc_info=True)
+
+
 class SubmissionView(discord.ui.View):
     def __init__(self, submitter_id: int, original_interaction_id: int, clan_of_submission: str, tier_name: str, source_name: str, item_name: str):
         super().__init__(timeout=None)
@@ -396,6 +642,32 @@ class SubmissionView(discord.ui.View):
 
 
 
+    def _template_score_source(self, template_doc: Dict[str, Any], source: TemplateSource, factor: float) -> float:
+        """Scores one compiled source's items into its 'source_gained' and returns it."""
+        s_data = template_doc["tiers"][source.tier_name]["sources"][source.index]
+        s_data["source_gained"] = 0.0
+        for i in source.item_indexes:
+            s_data["source_gained"] += _template_calculate_helper(s_data["items"][i]) * factor
+        logger.debug(f"{source.name}: {s_data['source_gained']} ({factor}x)")
+        return s_data["source_gained"]
+
+    def _template_store_totals(self, template_doc: Dict[str, Any], compiled: CompiledTemplate, source_points: List[float]) -> float:
+        """Sums source points into each tier's 'points_gained' and 'total_gained', in the order a full calculation adds them."""
+        tiers = template_doc.get("tiers", {})
+        for t_data in tiers.values():
+            if isinstance(t_data, dict):
+                t_data["points_gained"] = 0.0
+        for source, points in zip(compiled.sources, source_points):
+            tiers[source.tier_name]["points_gained"] += points
+
+        total_template_points = 0.0
+        for t_data in tiers.values():
+            if isinstance(t_data, dict):
+                total_template_points += t_data["points_gained"]
+
+        template_doc["total_gained"] = total_template_points
+        return total_template_points
+
     def _template_calculate_points(self, template_doc: Dict[str, Any]) -> float:
         """
         Calculates the total potential points for the template based on
@@ -403,263 +675,100 @@ class SubmissionView(discord.ui.View):
         including the "Frenzy" source multiplier logic,
         where a source becomes Frenzied if all its items have 'obtained' > 0.
         """
-        total_template_points = 0.0
-        clan_multipliers = template_doc.get("multipliers", [])
-
-        
-        for t_name, t_data in template_doc.get("tiers", {}).items():
-            if not isinstance(t_data, dict):
-                logger.warning(f"Malformed tier data for '{t_name}'. Skipping.")
-                continue
-            t_data["points_gained"] = 0.0
-
-            sources = t_data.get("sources", [])
-            if not isinstance(sources, list):
-                logger.warning(f"Malformed sources list for tier '{t_name}'. Skipping.")
-                continue
-
-            for s_data in sources:
-                if not isinstance(s_data, dict):
-                    logger.warning(f"Malformed source data in tier '{t_name}'. Skipping.")
-                    continue
-                s_data["source_gained"] = 0.0
-                source_name = s_data.get("name")
-
-                if not source_name:
-                    logger.warning(f"Source missing 'name' in tier '{t_name}'. Skipping.")
-                    continue
-
-                effective_multiplier_factor = 1.0
-                special_frenzy_applied_to_source = False
-
-                for multiplier in clan_multipliers:
-                    if not isinstance(multiplier, dict):
-                        logger.warning(f"Malformed multiplier data found: {multiplier}. Skipping.")
-                        continue
-
-                    multiplier_name = multiplier.get("name")
-
-                    if multiplier.get("unlocked", False) and does_multiplier_affect_source(multiplier, source_name):
-                        factor = float(multiplier.get("factor", 1.0))
-                        effective_multiplier_factor *= factor
-                        logger.debug(f"Applied multiplier '{multiplier_name}' ({factor}x) to source '{source_name}'.")
-
-                        if multiplier_name in SPECIAL_FRENZY_MULTIPLIER_NAMES:
-                            special_frenzy_applied_to_source = True
-
-
-                source_items = s_data.get("items", [])
-                if not isinstance(source_items, list):
-                    logger.warning(f"Source '{source_name}' has invalid 'items' field (not a list). Skipping Frenzy check.")
-                    source_items = []
-
-                all_items_uniquely_obtained_in_source = True
-                if not source_items:
-                    all_items_uniquely_obtained_in_source = False
-                else:
-                    for item_data in source_items:
-                        if not isinstance(item_data, dict):
-                            logger.warning(f"Malformed item data in source '{source_name}'. Skipping for Frenzy check.")
-                            all_items_uniquely_obtained_in_source = False
-                            break
-                        
-                        item_obtained_count = int(item_data.get("obtained", 0))
-
-                        if item_obtained_count <= 0:
-                            all_items_uniquely_obtained_in_source = False
-                            break
-
-
-                if all_items_uniquely_obtained_in_source and not special_frenzy_applied_to_source:
-                    FRENZY_DEFAULT_FACTOR = 1.25
-                    effective_multiplier_factor *= FRENZY_DEFAULT_FACTOR
-                    logger.debug(f"Applied default Frenzy multiplier ({FRENZY_DEFAULT_FACTOR}x) to source '{source_name}.")
-
-
-                source_before = 0
-                source_after = 0
-                for i_data in s_data.get("items", []):
-                    if not isinstance(i_data, dict):
-                        logger.warning(f"Malformed item data in source '{source_name}'. Skipping point calculation.")
-                        continue
-
-                    item_total_points_base = _template_calculate_helper(i_data)
-
-                    item_total_points_multiplied = item_total_points_base * effective_multiplier_factor
-                    source_before += item_total_points_base
-                    source_after += item_total_points_multiplied
-                    s_data["source_gained"] += item_total_points_multiplied
-                logger.debug(s_data["name"])
-                logger.debug(f"{source_before}: Base")
-                logger.debug(f"{source_after}: Multiplied")
-                t_data["points_gained"] += s_data["source_gained"]
-            total_template_points += t_data["points_gained"]
-
-        template_doc["total_gained"] = total_template_points
-
-        return total_template_points
+        # Compiled uncached: the document may have been edited in memory.
+        compiled = compile_template(template_doc)
+        source_points = [self._template_score_source(template_doc, source, source.template_factor) for source in compiled.sources]
+        return self._template_store_totals(template_doc, compiled, source_points)
 
-    async def _player_calulate_from_items(self,
-    player_document: Dict[str, Any],
-    template_document: Dict[str, Any]
-) -> float:
+    def _template_scores_before(self, template_doc: Dict[str, Any]) -> Tuple[CompiledTemplate, List[float], float]:
         """
-        Calculates a player's total points based on their obtained items,
-        applying applicable UNLOCKED clan multipliers and source-based multipliers.
-
-        Args:
-            player_document: The player's document from the database.
-            template_document: The clan's template document from the database.
-
-        Returns:
-            The calculated total points for the player.
+        Per-source points and total for the template as loaded. Reuses what this
+        bot saved with that version when the document still carries exactly
+        those points; otherwise scores the document in full.
+        """
+        compiled = get_compiled_template(template_doc)
+        cached = template_scores.get((str(template_doc.get("_id")), template_version(template_doc)))
+        if cached is not None:
+            source_points, total = cached
+            tiers = template_doc["tiers"]
+            if total == template_doc.get("total_gained") and len(source_points) == len(compiled.sources) and all(
+                tiers[source.tier_name]["sources"][source.index].get("source_gained") == points
+                for source, points in zip(compiled.sources, source_points)
+            ):
+                return compiled, list(source_points), total
+            # Another writer saved this version; don't trust the model carried over either.
+            compiled = compile_template(template_doc)
+            cache_compiled_template(template_doc, compiled)
+
+        source_points = [self._template_score_source(template_doc, source, source.template_factor) for source in compiled.sources]
+        return compiled, source_points, self._template_store_totals(template_doc, compiled, source_points)
+
+    def _template_rescore(self, template_doc: Dict[str, Any], compiled: CompiledTemplate, source_points: List[float], multipliers_before: List[Any]) -> Tuple[CompiledTemplate, float]:
+        """
+        Rescores only the sources one accepted item can change: its own source
+        (item points and Frenzy state) and every source a multiplier unlocked
+        since multipliers_before affects. Updates source_points in place and
+        returns the document's compiled model and its new total, equal to a
+        full _template_calculate_points.
+        """
+        affected_sources = {self.source_name}
+        for before, multiplier in zip(multipliers_before, template_doc.get("multipliers", [])):
+            was_unlocked = isinstance(before, dict) and before.get("unlocked", False)
+            if isinstance(multiplier, dict) and multiplier.get("unlocked", False) and not was_unlocked:
+                affected_sources.update(multiplier.get("affects", []))
+
+        compiled = recompile_sources(compiled, template_doc, affected_sources)
+        for i, source in enumerate(compiled.sources):
+            if source.name in affected_sources:
+                source_points[i] = self._template_score_source(template_doc, source, source.template_factor)
+        return compiled, self._template_store_totals(template_doc, compiled, source_points)
+
+    async def _player_obtained_count(self, player_document: Dict[str, Any], points_gained_this_submission: float, new_obtained_count_template: int) -> Optional[Dict[str, Any]]:
+        """
+        Atomically counts the item for the player and appends the submission,
+        returning the player document as saved. obtained_items keys contain
+        dots, so the count is incremented with $getField/$setField in an
+        update pipeline rather than a dotted $inc path.
         """
-        if not player_document or not template_document:
-            logger.error("Player or template document is missing for player total points calculation.")
-            return 0.0
-
-        player_total_points = 0.0
-        player_clan = player_document.get("clan")
-        player_obtained_items = player_document.get("obtained_items", {})
-
-        clan_multipliers = template_document.get("multipliers", [])
-        unlocked_clan_multipliers = [
-            m for m in clan_multipliers if m.get("unlocked", False)
-        ]
-
-
-
-        for item_key, obtained_count_player in player_obtained_items.items():
-            if not isinstance(item_key, str) or not isinstance(obtained_count_player, int) or obtained_count_player <= 0:
-                logger.warning(f"Malformed obtained_item entry for player {player_document.get('discord_id')}: {item_key}: {obtained_count_player}. Skipping.")
-                continue
-
-            parts = item_key.split('.')
-            if len(parts) != 3:
-                logger.warning(f"Invalid item_key format '{item_key}' for player {player_document.get('discord_id')}. Skipping.")
-                continue
-            tier_name, source_name, item_name = parts
-
-            item_info = await _template_find_helper(template_document, tier_name, source_name, item_name)
-            if not item_info or "item" not in item_info:
-                logger.warning(f"Item template data not found for item key '{item_key}' in template for clan '{player_clan}'. Skipping.")
-                continue
-            item_template_data = item_info["item"]
-
-
-            temp_item_data_for_calculation = item_template_data.copy()
-            temp_item_data_for_calculation["obtained"] = obtained_count_player
-
-
-            item_base_contribution = _player_calculate_helper(temp_item_data_for_calculation)
-
-            effective_unlocked_multiplier_factor = 1.0
-            for multiplier_data in unlocked_clan_multipliers:
-                if does_multiplier_affect_source(multiplier_data, source_name):
-                    factor = float(multiplier_data.get("factor", 1.0))
-                    effective_unlocked_multiplier_factor *= factor
-
-            item_total_contribution = item_base_contribution * effective_unlocked_multiplier_factor
-
-            player_total_points += item_total_contribution
-
-        return player_total_points
-
-    async def _player_obtained_count(self, player_document: Dict[str, Any], points_gained_this_submission: float, new_obtained_count_template: int):
-        player_obtained_items = player_document.get("obtained_items", {})
         item_key = f"{self.tier_name}.{self.source_name}.{self.item_name}"
-        player_obtained_items[item_key] = player_obtained_items.get(item_key, 0) + 1 
-        player_document["obtained_items"] = player_obtained_items
-
-
-
-        if "submissions" not in player_document: player_document["submissions"] = []
-        player_document["submissions"].append({
+        submission = {
             "item": self.item_name, "source": self.source_name, "tier": self.tier_name,
             "status": "accepted", "accepted_by": self.original_interaction_id,
             "timestamp": discord.utils.utcnow(), "points_awarded": points_gained_this_submission
-        })
-
+        }
+        obtained_items = {"$ifNull": ["$obtained_items", {}]}
+        return await player_coll.find_one_and_update(
+            {"_id": player_document["_id"]},
+            [{"$set": {
+                "obtained_items": {"$setField": {
+                    "field": item_key,
+                    "input": obtained_items,
+                    "value": {"$add": [{"$ifNull": [{"$getField": {"field": item_key, "input": obtained_items}}, 0]}, 1]},
+                }},
+                "submissions": {"$concatArrays": [{"$ifNull": ["$submissions", []]}, {"$literal": [submission]}]},
+                "updated_at": discord.utils.utcnow(),
+            }}],
+            return_document=ReturnDocument.AFTER,
+        )
 
-    async def _player_recalculate_all(self):
+    async def _player_store_total(self, player_document: Dict[str, Any], template_doc: Dict[str, Any], template_collection: AsyncCollection):
         """
-        Recalculates the total_gained points for ALL players in the database
-        based on their obtained_items and the latest UNLOCKED clan multipliers.
-        Updates each player's document in the database.
-
-        This function is intended for periodic execution, not on every submission.
+        Sets the player's total_gained from their saved items and the template
+        as this accept saved it. If another accept saved a newer template since,
+        its multipliers may have moved this total too: recompute against it.
+        A skipped write means a newer items or template state already owns the total.
         """
-        logger.info("Starting recalculation of all player points and database update.")
-
-        template_docs = {}
-        try:
-            if_template_doc = await if_coll.find_one({})
-            if if_template_doc:
-                template_docs["ironfoundry"] = if_template_doc
-            else:
-                logger.warning("Ironfoundry template document not found.")
-
-            ic_template_doc = await ic_coll.find_one({})
-            if ic_template_doc:
-                template_docs["ironclad"] = ic_template_doc
-            else:
-                logger.warning("Ironclad template document not found.")
-
-        except Exception as e:
-            logger.error(f"Error fetching template documents for global recalculation: {e}", exc_info=True)
-            return 
-
-        if not template_docs:
-            logger.warning("No template documents loaded. Skipping global player points recalculation.")
-            return
-
-
-        all_players_cursor = player_coll.find({})
-        all_players = await all_players_cursor.to_list(length=None)
-        logger.info(f"Fetched {len(all_players)} players for global recalculation.")
-
-        players_updated_count = 0
-        errors_count = 0
-
-        for player_doc in all_players:
-            player_id = player_doc.get("_id")
-            discord_id = player_doc.get("discord_id")
-            player_clan = player_doc.get("clan")
-
-            if not player_clan or player_clan not in template_docs:
-                logger.warning(f"Player {discord_id} has invalid/unknown clan '{player_clan}'. Skipping point recalculation for this player.")
-                errors_count += 1
-                continue
-
-            current_template = template_docs[player_clan]
-
-            try:
-                new_player_total_gained_unrounded = await self._player_calulate_from_items(
-                    player_doc,
-                    current_template
-                )
-
-                new_player_total_gained = round(new_player_total_gained_unrounded, 2)
-                
-                if not player_doc["total_gained"]:
-                    player_doc["total_gained"] = 0.0
-
-                old_player_total_gained = float(player_doc.get("total_gained", 0.0))
-
-                if new_player_total_gained != old_player_total_gained:
-                    player_doc["total_gained"] = new_player_total_gained
-
-                    update_result = await player_coll.replace_one({"_id": player_id}, player_doc)
-
-                    if update_result.modified_count > 0:
-                        players_updated_count += 1
-
-            except Exception as e:
-                logger.error(f"Error recalculating or updating points for player {discord_id} ({player_id}): {e}", exc_info=True)
-                errors_count += 1
-        logger.info(f"Players checked: {len(all_players)}, Players updated: {players_updated_count}, Errors: {errors_count}")
-
-
+        for _ in range(ACCEPT_SAVE_ATTEMPTS):
+            player_document["total_gained"] = round(await _player_calulate_from_items(player_document, template_doc), 2)
+            update_result = await player_coll.update_one(*_player_total_update(player_document, player_document["total_gained"], template_doc))
+            if not update_result.matched_count:
+                return
+            current = await template_collection.find_one({}, {"version": 1})
+            if not current or current.get("version") == template_doc.get("version"):
+                return
+            template_doc = await template_collection.find_one({})
+            if not template_doc:
+                return
 
     async def _submit_construct_message(self, interaction: discord.Interaction, button: discord.ui.Button, points_gained: float, player_total_points: float):
         """Sends feedback messages and disables buttons."""
@@ -694,56 +803,83 @@ class SubmissionView(discord.ui.View):
             return
         player_document, template_doc, template_collection = docs
 
-        # 2. Find Item in Template
-        item_info = await _template_find_helper(template_doc, self.tier_name, self.source_name, self.item_name)
-        if not item_info:
-            await interaction.followup.send(f"Error: Item '{self.item_name}' no longer found in template.", ephemeral=True)
-            return
-        item_template_data = item_info["item"]
-
-        # Store the state of the template document *before* this submission for point calculation later
-        import copy
-        template_doc_before_submission = copy.deepcopy(template_doc)
-
-
-        # 3. Check for Rejection
-        old_obtained_count_template = int(item_template_data.get("obtained", 0))
-        if await self._check_submission_rejection(item_template_data, old_obtained_count_template):
-            button.disabled = True
-            if len(self.children) > 1 and isinstance(self.children[1], discord.ui.Button): self.children[1].disabled = True
-            await interaction.message.edit(view=self) # type: ignore
-            await interaction.followup.send(
-                f"Submission for '{self.item_name}' by <@{self.submitter_id}> rejected by {interaction.user.mention}.\n"
-                f"Reason: Item has already reached its maximum point award threshold for the clan.",
-                ephemeral=False
-            )
-            return
+        for attempt in range(ACCEPT_SAVE_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, ACCEPT_RETRY_BASE_SECONDS * 2 ** attempt))
+                template_doc = await template_collection.find_one({})
+                if not template_doc:
+                    await interaction.followup.send("Error: Could not retrieve necessary data for processing.", ephemeral=True)
+                    return
+
+            # 2. Find Item in Template
+            item_info = await _template_find_helper(template_doc, self.tier_name, self.source_name, self.item_name)
+            if not item_info:
+                await interaction.followup.send(f"Error: Item '{self.item_name}' no longer found in template.", ephemeral=True)
+                return
+            item_template_data = item_info["item"]
+
+            # 3. Check for Rejection
+            old_obtained_count_template = int(item_template_data.get("obtained", 0))
+            if await self._check_submission_rejection(item_template_data, old_obtained_count_template):
+                button.disabled = True
+                if len(self.children) > 1 and isinstance(self.children[1], discord.ui.Button): self.children[1].disabled = True
+                await interaction.message.edit(view=self) # type: ignore
+                await interaction.followup.send(
+                    f"Submission for '{self.item_name}' by <@{self.submitter_id}> rejected by {interaction.user.mention}.\n"
+                    f"Reason: Item has already reached its maximum point award threshold for the clan.",
+                    ephemeral=False
+                )
+                return
 
-        # 4. Update Item Obtained Count in the TEMPLATE (modifies template_doc in place)
-        new_obtained_count_template = self._update_item_obtained_count(item_template_data)
+            # Score the template as it stands before this submission
+            stored_fields = _template_score_fields(template_doc)
+            compiled_template, source_points, total_template_points_before = self._template_scores_before(template_doc)
+            source_factors_before = compiled_template.source_factors
 
-        total_template_points_before = self._template_calculate_points(template_doc_before_submission)
+            # 4. Update Item Obtained Count in the TEMPLATE (modifies template_doc in place)
+            new_obtained_count_template = self._update_item_obtained_count(item_template_data)
 
-        newly_unlocked_multiplier_names = await _template_unlock_multi(template_doc, template_doc_before_submission)
+            # Only the multipliers are needed to tell which ones this submission unlocks
+            multipliers_before = copy.deepcopy(template_doc.get("multipliers", []))
+            newly_unlocked_multiplier_names = await _template_unlock_multi(template_doc, {"multipliers": multipliers_before})
+
+            compiled_template, total_template_points_after = self._template_rescore(template_doc, compiled_template, source_points, multipliers_before)
+
+            # 5. Save the TEMPLATE: the item's count, plus only the scores and unlocks that changed,
+            # provided no other accept saved the template since it was loaded.
+            template_update, array_filters = _template_accept_update(template_doc, stored_fields, self.tier_name, self.source_name, self.item_name)
+            template_update_result = await template_collection.update_one(
+                {"_id": template_doc["_id"], "version": template_doc.get("version")},
+                template_update,
+                array_filters=array_filters,
+            )
+            if template_update_result.matched_count:
+                break
+            logger.info(f"Template for clan '{self.clan_of_submission}' was saved by another accept; retrying '{self.item_name}' (attempt {attempt + 1}).")
+        else:
+            await interaction.followup.send("Error: The clan's template kept changing while saving. Please accept again.", ephemeral=True)
+            logger.error(f"Gave up saving '{self.item_name}' for clan '{self.clan_of_submission}' after {ACCEPT_SAVE_ATTEMPTS} attempts.")
+            return
 
         if newly_unlocked_multiplier_names:
              logger.info(f"Newly unlocked multipliers in this submission: {', '.join(newly_unlocked_multiplier_names)}")
-
-        total_template_points_after = self._template_calculate_points(template_doc)
         points_gained_this_submission = total_template_points_after - total_template_points_before
         logger.info(f"Points gained from this submission calculated based on template change: {points_gained_this_submission:.2f}")
 
+        template_doc["version"] = template_version(template_doc) + 1
+        # The next accept loads this version; carry the model and scores over instead of rebuilding them.
+        cache_compiled_template(template_doc, compiled_template._replace(version=template_doc["version"]))
+        template_scores[(str(template_doc["_id"]), template_doc["version"])] = (tuple(source_points), total_template_points_after)
 
-
-        # 5. Update Player Data
-        await self._player_obtained_count(player_document, points_gained_this_submission, new_obtained_count_template)
-
-        # 6. Save Changes to DB
-        template_replace_result = await template_collection.replace_one({"_id": template_doc["_id"]}, template_doc)
-        player_update_result = await player_coll.replace_one({"_id": player_document["_id"]}, player_document)
+        # 6. Update Player Data
+        saved_player_document = await self._player_obtained_count(player_document, points_gained_this_submission, new_obtained_count_template)
+        if saved_player_document is not None:
+            player_document = saved_player_document
+            if player_document.get("clan") == self.clan_of_submission:
+                await self._player_store_total(player_document, template_doc, template_collection)
 
         # 7. Send Feedback
-        if template_replace_result.acknowledged and player_update_result.acknowledged:
+        if saved_player_document is not None:
             await self._submit_construct_message(interaction, button, points_gained_this_submission, player_document["total_gained"])
             # Optional: Add information about newly unlocked multipliers to the feedback message
             if newly_unlocked_multiplier_names:
@@ -758,10 +894,16 @@ class SubmissionView(discord.ui.View):
 
         else:
             await interaction.followup.send("Error: Failed to save updates to the database.", ephemeral=True)
-            logger.error(f"DB save acknowledged status: Template={template_replace_result.acknowledged}, Player={player_update_result.acknowledged}")
+            logger.error(f"Player document {player_document['_id']} disappeared while accepting '{self.item_name}'; the template was saved.")
         
-        # 8. Recalculate Player points (leaderboards)
-        await self._player_recalculate_all()
+        # 8. Recalculate the points of other players whose sources' multipliers changed (leaderboards)
+        source_factors_after = compiled_template.source_factors
+        changed_sources = {
+            source_name for source_name in set(source_factors_before) | set(source_factors_after)
+            if source_factors_before.get(source_name, 1.0) != source_factors_after.get(source_name, 1.0)
+        }
+        if changed_sources:
+            await _player_recalculate_sources(self.clan_of_submission, template_doc, changed_sources, player_document["_id"])
 
 
     
@@ -1032,48 +1174,14 @@ async def list_source_multipliers(interaction: discord.Interaction, clan: str):
         await interaction.followup.send(f"Error: Template document for clan '{clan}' is missing.", ephemeral=True)
         return
 
-    clan_multipliers = template_doc.get("multipliers", [])
-    unlocked_clan_multipliers = [
-        m for m in clan_multipliers if isinstance(m, dict) and m.get("unlocked", False)
-    ]
-    logger.debug(f"Unlocked clan multipliers for {clan}: {[m.get('name', 'Unnamed') for m in unlocked_clan_multipliers]}")
-
-
-    source_multipliers_info: Dict[str, Dict[str, Any]] = {}
-
-    tiers = template_doc.get("tiers", {})
-    if isinstance(tiers, dict):
-        for t_name, t_data in tiers.items():
-            if isinstance(t_data, dict):
-                sources = t_data.get("sources", [])
-                if isinstance(sources, list):
-                    for s_data in sources:
-                        if isinstance(s_data, dict):
-                            source_name = s_data.get("name")
-                            if source_name:
-                                effective_multiplier_factor = 1.0
-                                applied_multiplier_names = []
-
-                                for multiplier_data in unlocked_clan_multipliers:
-                                    if does_multiplier_affect_source(multiplier_data, source_name):
-                                        factor = float(multiplier_data.get("factor", 1.0))
-                                        effective_multiplier_factor *= factor
-                                        applied_multiplier_names.append(multiplier_data.get("name", "Unnamed"))
-
-                                source_multipliers_info[source_name] = {
-                                    "factor": round(effective_multiplier_factor, 2),
-                                    "applied_by": applied_multiplier_names
-                                }
-                            else:
-                                logger.warning(f"Source data in tier '{t_name}' is missing 'name'. Skipping.")
-                        else:
-                            logger.warning(f"Invalid source data in tier '{t_name}' (not a dict). Skipping.")
-                else:
-                    logger.warning(f"Sources field in tier '{t_name}' is not a list. Skipping.")
-            else:
-                logger.warning(f"Tier data for '{t_name}' is not a dict. Skipping.")
-    else:
-        logger.warning("Template 'tiers' field is not a dictionary. Cannot calculate source multipliers.")
+    compiled = get_compiled_template(template_doc)
+    source_multipliers_info: Dict[str, Dict[str, Any]] = {
+        source.name: {
+            "factor": round(source.factor, 2),
+            "applied_by": list(compiled.source_multipliers.get(source.name, ())),
+        }
+        for source in compiled.sources
+    }
 
 
     embed = Embed(
@@ -1232,5 +1340,9 @@ def setup(client: discord.Client, mongo_client: AsyncMongoClient | None):
     #client.tree.add_command(list_source_multipliers, guild=client.selected_guild)
     #client.tree.add_command(tracking, guild=client.selected_guild)
     client.tree.add_command(submit, guild=client.selected_guild) # type: ignore
+
+    global player_recalculate_task
+    if PLAYER_RECALCULATE_INTERVAL_MINUTES > 0 and player_recalculate_task is None:
+        player_recalculate_task = asyncio.create_task(_player_recalculate_loop())
     #client.tree.add_command(precheck, guild=client.selected_guild)
     #client.tree.add_command(status, guild=client.selected_guild)
\ No newline at end of file
@@ -0,0 +1,224 @@
+# modules/template_index.py
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Tuple
+
+from cachetools import LRUCache
+from loguru import logger
+
+
+FRENZY_DEFAULT_FACTOR = 1.25
+
+# Sources affected by one of these unlocked multipliers don't get the default Frenzy factor on top.
+SPECIAL_FRENZY_MULTIPLIER_NAMES = {
+    "Banana Split",
+    "Demon Slayer II",
+    "Oscar Worthy",
+    "How to Smelt Your Dragon",
+    "Raining Blood",
+    "The Zarosian Candidate",
+    "Rock Solid",
+    "Shape of Italy",
+    "Mystic Pizza",
+    "Eye of the Beholder",
+    "Lord of Bones",
+    "Man Purse",
+    "Gonna Need a Bigger Boat",
+    "Kitchen Nightmares",
+    "Rogue One",
+    "Throwing Shade",
+    "Get to the Chompa!",
+    "Return the Slab",
+    "Deadliest Catch",
+    "What's in the Box?!",
+    "Rag and Bone Man III",
+    "Agent of Chaos",
+    "The Blade that was Broken",
+    "Tzhaar Wars",
+    "CANNONBALL!"
+}
+
+
+class TemplateItem(NamedTuple):
+    key: str            # "tier.source.item", as stored in a player's obtained_items
+    tier_name: str
+    source_name: str
+    name: str
+    points: float
+    source_index: int   # Position of the source in its tier's "sources" list
+    item_index: int     # Position of the item in its source's "items" list
+
+
+class TemplateSource(NamedTuple):
+    tier_name: str
+    name: str
+    index: int
+    item_indexes: Tuple[int, ...]  # Items that are well-formed dicts
+    factor: float                  # Unlocked clan multipliers only; what players earn with
+    template_factor: float         # factor, plus the default Frenzy factor once every item is obtained
+
+
+class CompiledTemplate(NamedTuple):
+    version: int
+    items: Mapping[str, TemplateItem]
+    sources: Tuple[TemplateSource, ...]
+    source_factors: Mapping[str, float]               # Source name -> unlocked multiplier factor
+    source_multipliers: Mapping[str, Tuple[str, ...]] # Source name -> names of the unlocked multipliers applied
+
+
+def unlocked_source_multipliers(template_doc: Dict[str, Any]) -> Tuple[Dict[str, float], Dict[str, List[str]], set]:
+    """Folds every unlocked multiplier into per-source factors, in the multipliers' list order."""
+    factors: Dict[str, float] = {}
+    applied: Dict[str, List[str]] = {}
+    special_frenzy_sources = set()
+    for multiplier in template_doc.get("multipliers", []):
+        if not isinstance(multiplier, dict):
+            logger.warning(f"Malformed multiplier data found: {multiplier}. Skipping.")
+            continue
+        if not multiplier.get("unlocked", False):
+            continue
+
+        factor = float(multiplier.get("factor", 1.0))
+        multiplier_name = multiplier.get("name")
+        for source_name in dict.fromkeys(multiplier.get("affects", [])):
+            factors[source_name] = factors.get(source_name, 1.0) * factor
+            applied.setdefault(source_name, []).append(multiplier.get("name", "Unnamed"))
+            if multiplier_name in SPECIAL_FRENZY_MULTIPLIER_NAMES:
+                special_frenzy_sources.add(source_name)
+    return factors, applied, special_frenzy_sources
+
+
+def source_template_factor(source_name: str, s_items: List[Any], item_indexes: Tuple[int, ...], factors: Dict[str, float], special_frenzy_sources: set) -> float:
+    """The factor a source's template points are scored with, given the unlocked multipliers' factors."""
+    factor = factors.get(source_name, 1.0)
+    # Frenzied: the source has items, all well-formed, and every one obtained at least once.
+    frenzied = bool(s_items) and len(item_indexes) == len(s_items) and all(
+        int(s_items[i].get("obtained", 0)) > 0 for i in item_indexes
+    )
+    if frenzied and source_name not in special_frenzy_sources:
+        factor *= FRENZY_DEFAULT_FACTOR
+    return factor
+
+
+def compile_template(template_doc: Dict[str, Any]) -> CompiledTemplate:
+    """
+    Builds the lookup model for a template document as it is right now:
+    items by "tier.source.item" key and every source's multiplier factors.
+    Malformed tiers, sources and items are skipped with a warning.
+    """
+    factors, applied, special_frenzy_sources = unlocked_source_multipliers(template_doc)
+
+    items: Dict[str, TemplateItem] = {}
+    sources: List[TemplateSource] = []
+    tiers = template_doc.get("tiers", {})
+    if not isinstance(tiers, dict):
+        logger.warning("Template 'tiers' field is not a dictionary. Compiling an empty template.")
+        tiers = {}
+
+    for t_name, t_data in tiers.items():
+        if not isinstance(t_data, dict):
+            logger.warning(f"Malformed tier data for '{t_name}'. Skipping.")
+            continue
+        t_sources = t_data.get("sources", [])
+        if not isinstance(t_sources, list):
+            logger.warning(f"Malformed sources list for tier '{t_name}'. Skipping.")
+            continue
+
+        for s_index, s_data in enumerate(t_sources):
+            if not isinstance(s_data, dict):
+                logger.warning(f"Malformed source data in tier '{t_name}'. Skipping.")
+                continue
+            source_name = s_data.get("name")
+            if not source_name:
+                logger.warning(f"Source missing 'name' in tier '{t_name}'. Skipping.")
+                continue
+
+            s_items = s_data.get("items", [])
+            if not isinstance(s_items, list):
+                logger.warning(f"Source '{source_name}' has invalid 'items' field (not a list). Skipping its items.")
+                s_items = []
+
+            item_indexes = []
+            for i_index, i_data in enumerate(s_items):
+                if not isinstance(i_data, dict):
+                    logger.warning(f"Malformed item data in source '{source_name}'. Skipping.")
+                    continue
+                item_indexes.append(i_index)
+                item_name = i_data.get("name")
+                if not item_name:
+                    continue
+                try:
+                    points = float(i_data.get("points", 0))
+                except (TypeError, ValueError):
+                    logger.warning(f"Item '{item_name}' in source '{source_name}' has non-numeric points. Skipping.")
+                    continue
+                key = f"{t_name}.{source_name}.{item_name}"
+                # The first match wins, as with the old linear search.
+                if key not in items:
+                    items[key] = TemplateItem(key, t_name, source_name, item_name, points, s_index, i_index)
+
+            item_indexes = tuple(item_indexes)
+            sources.append(TemplateSource(
+                t_name, source_name, s_index, item_indexes, factors.get(source_name, 1.0),
+                source_template_factor(source_name, s_items, item_indexes, factors, special_frenzy_sources),
+            ))
+
+    return CompiledTemplate(
+        version=template_version(template_doc),
+        items=MappingProxyType(items),
+        sources=tuple(sources),
+        source_factors=MappingProxyType(factors),
+        source_multipliers=MappingProxyType({name: tuple(names) for name, names in applied.items()}),
+    )
+
+
+def recompile_sources(compiled: CompiledTemplate, template_doc: Dict[str, Any], source_names: set) -> CompiledTemplate:
+    """
+    The compiled model for template_doc when it differs from compiled only in
+    obtained counts and unlocked multipliers of the named sources, without
+    walking every item again. Equal to compile_template(template_doc).
+    """
+    factors, applied, special_frenzy_sources = unlocked_source_multipliers(template_doc)
+    tiers = template_doc["tiers"]
+    sources = []
+    for source in compiled.sources:
+        if source.name in source_names:
+            s_items = tiers[source.tier_name]["sources"][source.index].get("items", [])
+            if not isinstance(s_items, list):
+                s_items = []
+            source = source._replace(
+                factor=factors.get(source.name, 1.0),
+                template_factor=source_template_factor(source.name, s_items, source.item_indexes, factors, special_frenzy_sources),
+            )
+        sources.append(source)
+
+    return compiled._replace(
+        version=template_version(template_doc),
+        sources=tuple(sources),
+        source_factors=MappingProxyType(factors),
+        source_multipliers=MappingProxyType({name: tuple(names) for name, names in applied.items()}),
+    )
+
+
+def template_version(template_doc: Dict[str, Any]) -> int:
+    """The document's "version"; 0 for a document no writer has versioned yet."""
+    return template_doc.get("version", 0)
+
+
+def cache_compiled_template(template_doc: Dict[str, Any], compiled: CompiledTemplate):
+    """Remembers compiled as the model of template_doc's _id and version, e.g. right after saving it."""
+    compiled_templates[(str(template_doc.get("_id")), template_version(template_doc))] = compiled
+
+
+# Keyed by (template _id, version): every writer bumps "version", so a hit is
+# the same template content. A document without "version" is version 0 until
+# its first save $inc's the field to 1.
+compiled_templates = LRUCache(maxsize=8)
+
+
+def get_compiled_template(template_doc: Dict[str, Any]) -> CompiledTemplate:
+    """Returns the compiled model for a template document as loaded from the database."""
+    cache_key = (str(template_doc.get("_id")), template_version(template_doc))
+    compiled = compiled_templates.get(cache_key)
+    if compiled is None:
+        compiled = compiled_templates[cache_key] = compile_template(template_doc)
+    return compiled
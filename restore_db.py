@@ -19,12 +19,90 @@ player_coll = db["Players"]
 ironfoundry_template_coll = db["ironfoundry"] # Correct collection for IF templates
 ironclad_template_coll = db["ironclad"]   # Correct collection for IC templates
 
+# Saves retried when the template's version moved on since it was read
+TEMPLATE_SAVE_ATTEMPTS = 5
+
 # Mapping clan names to their template collections
 CLAN_TEMPLATE_COLLS = {
     "ironfoundry": ironfoundry_template_coll,
     "ironclad": ironclad_template_coll,
 }
 
+def sum_player_obtained_items(clan_players: List[Dict[str, Any]], clan_name: str) -> Dict[str, int]:
+    """Totals every item key across the clan's players' obtained_items."""
+    clan_item_obtained_counts: Dict[str, int] = {}
+    for player_doc in clan_players:
+
+        obtained_items = player_doc.get("obtained_items", {})
+        if not isinstance(obtained_items, dict):
+            logger.warning(f"Player {player_doc.get('discord_id')} in clan {clan_name} has invalid 'obtained_items' field (not a dictionary). Skipping.")
+            continue
+
+        for item_key, count in obtained_items.items():
+            if isinstance(item_key, str):
+                try:
+                    count_int = int(count)
+                    if item_key not in clan_item_obtained_counts:
+                        clan_item_obtained_counts[item_key] = 0
+
+                    clan_item_obtained_counts[item_key] += count_int
+                except (ValueError, TypeError):
+                    logger.warning(f"Non-integer count for item key '{item_key}' in obtained_items for player {player_doc.get('discord_id')} in clan {clan_name}. Skipping.")
+                    continue 
+            else:
+                logger.warning(f"Non-string item key '{item_key}' in obtained_items for player {player_doc.get('discord_id')} in clan {clan_name}. Skipping.")
+    return clan_item_obtained_counts
+
+
+def apply_obtained_counts(template_doc: Dict[str, Any], clan_item_obtained_counts: Dict[str, int], clan_name: str) -> bool:
+    """Sets each template item's 'obtained' to the players' total; returns whether any changed."""
+    template_modified = False
+    template_tiers = template_doc.get("tiers", {})
+    if not isinstance(template_tiers, dict):
+        logger.error(f"Template document for '{clan_name}' has an invalid 'tiers' field (not a dictionary). Skipping restoration for this clan.")
+        return False
+
+    for t_name, t_data in template_tiers.items():
+        if not isinstance(t_data, dict): continue
+        sources = t_data.get("sources", [])
+        if not isinstance(sources, list): continue 
+
+        for s_data in sources:
+            if not isinstance(s_data, dict): continue 
+            items = s_data.get("items", [])
+            if not isinstance(items, list): continue 
+            source_name = s_data.get("name")
+
+            if source_name:
+                for i_data in items:
+                    if not isinstance(i_data, dict): continue 
+                    item_name = i_data.get("name")
+
+                    if item_name:
+                        # Construct the unique item key matching the player's obtained_items format
+                        item_key = f"{t_name}.{source_name}.{item_name}"
+
+                        # Get the calculated total obtained count for this item
+                        calculated_total_obtained = clan_item_obtained_counts.get(item_key, 0)
+
+                        # Update the 'obtained' field in the template entry
+                        current_obtained_value = i_data.get("obtained", 0)
+                        try:
+                            # Convert current_obtained_value to int before comparison/setting
+                            current_obtained_int = int(current_obtained_value)
+
+                            if current_obtained_int != calculated_total_obtained:
+                                i_data["obtained"] = calculated_total_obtained # Set the obtained count
+                                template_modified = True
+                                logger.debug(f"Restored obtained count for '{item_key}' in template for '{clan_name}' to {calculated_total_obtained}. Old value was {current_obtained_int}.")
+                            else:
+                                 logger.debug(f"Obtained count for '{item_key}' in template for '{clan_name}' is already correct ({calculated_total_obtained}).")
+
+                        except (ValueError, TypeError):
+                            logger.error(f"Could not convert current 'obtained' value to int for item '{item_key}' in template for '{clan_name}'. Skipping update for this item.")
+    return template_modified
+
+
 async def restore_template_obtained_counts():
     logger.info("Starting template item obtained counts restoration script from player obtained_items.")
 
@@ -43,10 +121,6 @@ async def restore_template_obtained_counts():
                  logger.error(f"Template document in '{template_coll.name}' for '{clan_name}' has an invalid 'tiers' field (not a dictionary). Skipping restoration for this clan.")
                  continue
 
-            clan_item_obtained_counts: Dict[str, int] = {} 
-
-
-
             players_cursor = player_coll.find({"clan": clan_name}) 
             clan_players = await players_cursor.to_list(length=None)
             logger.info(f"Fetched {len(clan_players)} players for clan {clan_name}.")
@@ -56,90 +130,45 @@ async def restore_template_obtained_counts():
             continue 
 
 
-        for player_doc in clan_players:
-
-            obtained_items = player_doc.get("obtained_items", {})
-            if not isinstance(obtained_items, dict):
-                logger.warning(f"Player {player_doc.get('discord_id')} in clan {clan_name} has invalid 'obtained_items' field (not a dictionary). Skipping.")
-                continue
-
-            for item_key, count in obtained_items.items():
-                if isinstance(item_key, str):
-                    try:
-                        count_int = int(count)
-                        if item_key not in clan_item_obtained_counts:
-                            clan_item_obtained_counts[item_key] = 0
-
-                        clan_item_obtained_counts[item_key] += count_int
-                    except (ValueError, TypeError):
-                        logger.warning(f"Non-integer count for item key '{item_key}' in obtained_items for player {player_doc.get('discord_id')} in clan {clan_name}. Skipping.")
-                        continue 
-                else:
-                    logger.warning(f"Non-string item key '{item_key}' in obtained_items for player {player_doc.get('discord_id')} in clan {clan_name}. Skipping.")
-
-
+        clan_item_obtained_counts = sum_player_obtained_items(clan_players, clan_name)
         logger.info(f"Finished processing player obtained_items for clan {clan_name}. Calculated item obtained totals: {clan_item_obtained_counts}")
 
 
-        template_modified = False
-
-
-        for t_name, t_data in template_tiers.items():
-            if not isinstance(t_data, dict): continue
-            sources = t_data.get("sources", [])
-            if not isinstance(sources, list): continue 
-
-            for s_data in sources:
-                if not isinstance(s_data, dict): continue 
-                items = s_data.get("items", [])
-                if not isinstance(items, list): continue 
-                source_name = s_data.get("name")
-
-                if source_name:
-                    for i_data in items:
-                        if not isinstance(i_data, dict): continue 
-                        item_name = i_data.get("name")
-
-                        if item_name:
-                            # Construct the unique item key matching the player's obtained_items format
-                            item_key = f"{t_name}.{source_name}.{item_name}"
-
-                            # Get the calculated total obtained count for this item
-                            calculated_total_obtained = clan_item_obtained_counts.get(item_key, 0)
-
-                            # Update the 'obtained' field in the template entry
-                            current_obtained_value = i_data.get("obtained", 0)
-                            try:
-                                # Convert current_obtained_value to int before comparison/setting
-                                current_obtained_int = int(current_obtained_value)
-
-                                if current_obtained_int != calculated_total_obtained:
-                                    i_data["obtained"] = calculated_total_obtained # Set the obtained count
-                                    template_modified = True
-                                    logger.debug(f"Restored obtained count for '{item_key}' in template for '{clan_name}' to {calculated_total_obtained}. Old value was {current_obtained_int}.")
-                                else:
-                                     logger.debug(f"Obtained count for '{item_key}' in template for '{clan_name}' is already correct ({calculated_total_obtained}).")
-
-                            except (ValueError, TypeError):
-                                logger.error(f"Could not convert current 'obtained' value to int for item '{item_key}' in template for '{clan_name}'. Skipping update for this item.")
-
-
-        if template_modified:
+        # Save only over the version that was read; an accept saving in between makes this re-read and recount.
+        for attempt in range(TEMPLATE_SAVE_ATTEMPTS):
+            if attempt:
+                try:
+                    template_doc = await template_coll.find_one({"_id": template_doc["_id"]})
+                    clan_players = await player_coll.find({"clan": clan_name}).to_list(length=None)
+                except Exception as e:
+                    logger.error(f"Error re-fetching template or players for clan {clan_name}: {e}", exc_info=True)
+                    break
+                if not template_doc:
+                    logger.error(f"Template document for clan '{clan_name}' disappeared while restoring obtained counts.")
+                    break
+                clan_item_obtained_counts = sum_player_obtained_items(clan_players, clan_name)
+
+            if not apply_obtained_counts(template_doc, clan_item_obtained_counts, clan_name):
+                logger.info(f"No item obtained counts were updated in the template for clan '{clan_name}'.")
+                break
+
+            read_version = template_doc.get("version")
+            template_doc["version"] = (read_version or 0) + 1
             try:
                 update_result = await template_coll.replace_one(
-                    {"_id": template_doc["_id"]},
+                    {"_id": template_doc["_id"], "version": read_version},
                     template_doc
                 )
-
-                if update_result.modified_count > 0:
-                    logger.info(f"Successfully saved restored template document for clan '{clan_name}'.")
-                else:
-                    logger.warning(f"Restored template document for clan '{clan_name}' was not modified despite calculations (replace_one didn't report changes).")
-
             except Exception as e:
                 logger.error(f"Error saving restored template document for clan {clan_name}: {e}", exc_info=True)
+                break
+
+            if update_result.matched_count:
+                logger.info(f"Successfully saved restored template document for clan '{clan_name}'.")
+                break
+            logger.warning(f"Template for clan '{clan_name}' was saved by another writer since it was read; recounting (attempt {attempt + 1}).")
         else:
-            logger.info(f"No item obtained counts were updated in the template for clan '{clan_name}'.")
+            logger.error(f"Gave up saving restored obtained counts for clan '{clan_name}' after {TEMPLATE_SAVE_ATTEMPTS} attempts.")
 
 
     logger.info("Template item obtained counts restoration script finished.")
@@ -6,7 +6,7 @@ import io
 import httpx
 from loguru import logger
 from dotenv import load_dotenv
-from typing import Dict, Any, List, Literal
+from typing import Dict, Any, List, Literal, Optional
 from pymongo import AsyncMongoClient
 from tqdm.asyncio import tqdm
 
@@ -170,7 +170,11 @@ WOM_METRIC_NAME_TO_INTERNAL_NAME: Dict[str, str] = {
 # Define the actual header names found in the CSV
 ACTUAL_HEADERS = ["Rank", "Username", "Team", "Start", "End", "Gained", "Last Updated"]
 
-MILSTONES_ENDPOINT = "https://frenzy.ironfoundry.cc/milestones"
+MILSTONES_ENDPOINT = "https://frenzy.ironfoundry.cc/milestones/batch"
+# Per-team totals the backend computes while refreshing its WOM boards. Metrics
+# it does not fetch (see WOM_STANDINGS_METRICS there) fall back to the CSV.
+STANDINGS_ENDPOINT = "https://frenzy.ironfoundry.cc/standings"
+TEAM_TO_CLAN = {"Iron Foundry": "ironfoundry", "Ironclad": "ironclad"}
 
 DELAY_BETWEEN_METRICS = 7
 CYCLE_SLEEP_TIME = 300
@@ -276,8 +280,19 @@ METRIC_CATEGORIES: Dict[wom.Metric, Literal["cluescroll", "experience", "killcou
 }
 
 
-async def update_milestones_for_metric(metric: wom.Metric, http_client: httpx.AsyncClient):
-    """Fetches data for a single metric and sends it to the milestones endpoint."""
+async def fetch_standings(http_client: httpx.AsyncClient) -> Dict[str, Dict[str, Any]]:
+    """Fetches the backend's per-team standings, keyed by WOM metric value; empty if unavailable."""
+    try:
+        response = await http_client.get(STANDINGS_ENDPOINT)
+        response.raise_for_status()
+        return {standing["metric"]: standing for standing in response.json()["Data"]}
+    except Exception as e:
+        logger.warning(f"Could not fetch standings, falling back to WOM CSVs for every metric: {e}")
+        return {}
+
+
+async def collect_milestones_for_metric(metric: wom.Metric, standing: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Dict[str, Dict[str, int]]]]:
+    """Returns a single metric's per-clan milestone totals, from its standing when given, else from the WOM CSV."""
     wom_metric_name = metric.name # Get the string name from WOM metric
 
     # Map the WOM metric name to internal database name
@@ -285,23 +300,27 @@ async def update_milestones_for_metric(metric: wom.Metric, http_client: httpx.As
     if internal_metric_name is None:
         # Keep warnings for missing mappings
         logger.warning(f"Internal mapping missing for WOM metric name: {wom_metric_name}. Skipping.")
-        return
+        return None
 
     # Determine the category for this metric (cluescroll, experience, killcount)
     metric_category = METRIC_CATEGORIES.get(metric)
     if metric_category is None:
         # Keep warnings for missing categories
         logger.warning(f"Metric category missing for WOM metric: {wom_metric_name}. Skipping.")
-        return
-
-    # Tqdm description will handle the current metric name
-    # logger.info(f"Fetching data for {wom_metric_name} (Category: {metric_category}, Mapped to: {internal_metric_name})...")
+        return None
 
     data_for_milestones: Dict[str, Dict[str, Dict[str, int]]] = {
         "ironfoundry": {metric_category: {internal_metric_name: 0}},
         "ironclad": {metric_category: {internal_metric_name: 0}}
     }
 
+    if standing is not None:
+        for team in standing["teams"]:
+            clan_name = TEAM_TO_CLAN.get(team["team"])
+            if clan_name:
+                data_for_milestones[clan_name][metric_category][internal_metric_name] = int(team["total"])
+        return data_for_milestones
+
     COMPETITION_ID = 90513
 
     try:
@@ -333,42 +352,49 @@ async def update_milestones_for_metric(metric: wom.Metric, http_client: httpx.As
                     elif clan_name_csv == "Ironclad":
                         data_for_milestones["ironclad"][metric_category][internal_metric_name] = int(total_gained)
 
-
-
-        try:
-            # Tqdm description handles sending info
-            # logger.info(f"Sending data for {internal_metric_name} to {MILSTONES_ENDPOINT}")
-            response = await http_client.post(MILSTONES_ENDPOINT, json=data_for_milestones)
-            response.raise_for_status()
-            # Optional: Keep a successful send log if needed, but could make output busy
-            # logger.info(f"Successfully sent data for {internal_metric_name}. Status: {response.status_code}")
-        except httpx.RequestError as e:
-             logger.error(f"An error occurred while requesting {e.request.url} for {internal_metric_name}: {e}")
-        except httpx.HTTPStatusError as e:
-             logger.error(f"HTTP error {e.response.status_code} when sending data for {internal_metric_name}: {e.response.text}")
-        except Exception as e:
-             logger.error(f"An unexpected error occurred while sending data for {internal_metric_name}: {e}")
-
-
     except Exception as e:
-        # Keep error logging
+        # Keep error logging; a failed metric is left out of the batch rather than zeroed.
         logger.error(f"Error fetching or processing data for {wom_metric_name}: {e}", exc_info=True)
+        return None
 
     return data_for_milestones
 
 
+async def send_milestone_batch(batch: Dict[str, Dict[str, Dict[str, int]]], http_client: httpx.AsyncClient):
+    """Sends every collected milestone value in a single POST."""
+    try:
+        response = await http_client.post(MILSTONES_ENDPOINT, json=batch)
+        response.raise_for_status()
+        logger.info(f"Sent milestone batch: {response.json().get('results')}")
+    except httpx.RequestError as e:
+         logger.error(f"An error occurred while requesting {e.request.url} for the milestone batch: {e}")
+    except httpx.HTTPStatusError as e:
+         logger.error(f"HTTP error {e.response.status_code} when sending the milestone batch: {e.response.text}")
+    except Exception as e:
+         logger.error(f"An unexpected error occurred while sending the milestone batch: {e}")
+
+
 async def milestone_update():
-    """Periodically updates milestones for each metric with a delay."""
+    """Collects milestones for each metric (delayed for WOM) and posts them as one batch."""
     await client.start()
 
     async with httpx.AsyncClient() as http_client:
+        standings = await fetch_standings(http_client)
+
+        batch: Dict[str, Dict[str, Dict[str, int]]] = {"ironfoundry": {}, "ironclad": {}}
         # Wrap the loop with tqdm.asyncio for milestones
-        for metric in tqdm(METRICS_TO_TRACK, desc="Updating Milestones", unit="metric"):
-            await update_milestones_for_metric(metric, http_client)
+        for metric in tqdm(METRICS_TO_TRACK, desc="Collecting Milestones", unit="metric"):
+            standing = standings.get(metric.value)
+            data_for_milestones = await collect_milestones_for_metric(metric, standing)
+            if data_for_milestones:
+                for clan, categories in data_for_milestones.items():
+                    for category, metrics in categories.items():
+                        batch[clan].setdefault(category, {}).update(metrics)
 
-            await asyncio.sleep(7) # Keep a small sleep
+            if standing is None:
+                await asyncio.sleep(DELAY_BETWEEN_METRICS) # WOM rate limit, not the milestones endpoint
 
-        # No need for the "Finished a full cycle" log here, the end of the tqdm bar indicates completion
+        await send_milestone_batch(batch, http_client)
 
 
 mongo_client = AsyncMongoClient(MONGO_URI, maxPoolSize=None, maxIdleTimeMS=60000 * 5, maxConnecting=10)
@@ -487,7 +513,10 @@ async def aggregate_activity_data():
 
 
         # --- Update the clan's template document with aggregated values ---
-        template_modified = False
+        # Only the changed activity values are set, through arrayFilters, and the version is bumped with them,
+        # so this never overwrites what a concurrent accept saved elsewhere in the template.
+        set_fields: Dict[str, Any] = {}
+        array_filters: List[Dict[str, Any]] = []
         for activity_name, metrics_diffs in aggregated_diffs.items():
             for metric_name, total_difference in metrics_diffs.items():
                 # Find the corresponding entry in the template's activities array
@@ -495,28 +524,30 @@ async def aggregate_activity_data():
                 template_activity_entry = template_activity_map.get(template_entry_key)
 
                 if template_activity_entry:
-                    # Add the aggregated difference to the current_value in the template entry
-                    current_value = template_activity_entry.get("current_value", 0.0) # Default to 0.0 for numeric
                     try:
-                        template_activity_entry["current_value"] = float(total_difference) # Ensure numeric addition
-                        template_modified = True
-                        # Keep debug if needed for detailed updates, otherwise remove
-                        logger.debug(f"Updated current_value for '{activity_name}' ({metric_name}) in template for '{clan_name}' by {total_difference}. New value: {template_activity_entry['current_value']}")
+                        new_value = float(total_difference) # Ensure numeric
                     except (ValueError, TypeError):
                          # Keep error logging
                          logger.error(f"Could not convert current_value or total_difference to float for '{activity_name}' ({metric_name}) in template for '{clan_name}'. Skipping update for this metric.")
                          continue
+                    if template_activity_entry.get("current_value") == new_value:
+                        continue
+                    i = len(array_filters)
+                    set_fields[f"activities.$[a{i}].current_value"] = new_value
+                    array_filters.append({f"a{i}.name": activity_name, f"a{i}.unit": metric_name})
+                    # Keep debug if needed for detailed updates, otherwise remove
+                    logger.debug(f"Updated current_value for '{activity_name}' ({metric_name}) in template for '{clan_name}' by {total_difference}. New value: {new_value}")
                 else:
                     # Keep warnings
                     logger.warning(f"Matching activity entry not found in template in '{template_coll.name}' for '{clan_name}' for tracking data: '{activity_name}' ({metric_name}). Skipping update for this metric.")
 
-        # Save the updated template document if any changes were made
-        if template_modified:
+        # Save the updated activity values if any changed
+        if set_fields:
             try:
-                # Use replace_one to save the modifications to the activities array
-                update_result = await template_coll.replace_one(
+                update_result = await template_coll.update_one(
                     {"_id": template_doc["_id"]},
-                    template_doc
+                    {"$set": set_fields, "$inc": {"version": 1}},
+                    array_filters=array_filters,
                 )
 
                 if update_result.modified_count > 0:
@@ -524,7 +555,7 @@ async def aggregate_activity_data():
                     logger.info(f"Successfully saved updated template document for clan '{clan_name}'.")
                 else:
                     # Keep warning if no changes reported
-                    logger.warning(f"Template document for clan '{clan_name}' was not modified despite aggregation (replace_one didn't report changes).")
+                    logger.warning(f"Template document for clan '{clan_name}' was not modified despite aggregation (update_one didn't report changes).")
 
             except Exception as e:
                 # Keep error logging
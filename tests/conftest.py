@@ -0,0 +1,59 @@
+import copy
+import csv
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "discordbot"))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+
+@pytest.fixture(scope="session")
+def submit():
+    """The bot's submit command module; needs the bot's requirements installed."""
+    for requirement in ("discord", "upyloadthing", "cachetools", "pymongo"):
+        pytest.importorskip(requirement)
+    from loguru import logger
+    from client.commands import submit
+    # The bot logs every accept; keep the replays' timings about the scoring.
+    logger.disable("client")
+    yield submit
+    logger.enable("client")
+
+
+@pytest.fixture(scope="session")
+def backend():
+    """The API's app module; needs the backend's requirements installed."""
+    for requirement in ("fastapi", "wom", "msgspec", "cachetools", "pymongo"):
+        pytest.importorskip(requirement)
+    from loguru import logger
+    import app
+    logger.disable("app")
+    yield app
+    logger.enable("app")
+
+
+@pytest.fixture(scope="session")
+def fresh_template():
+    """The exported template with nothing obtained yet and every multiplier locked."""
+    with open(os.path.join(ROOT, "test.txt")) as f:
+        template_doc = json.load(f)
+    for tier_data in template_doc["tiers"].values():
+        for source_data in tier_data["sources"]:
+            for item_data in source_data["items"]:
+                item_data["obtained"] = 0
+    for multiplier in template_doc.get("multipliers", []):
+        multiplier["unlocked"] = False
+    template_doc["version"] = 1
+    return lambda: copy.deepcopy(template_doc)
+
+
+@pytest.fixture(scope="session")
+def accepted_submissions():
+    """Accepted rows of the submissions export, oldest first."""
+    with open(os.path.join(ROOT, "submissions_export.csv"), newline="") as f:
+        rows = [row for row in csv.DictReader(f) if row["status"] == "accepted"]
+    return sorted(rows, key=lambda row: row["timestamp"])
@@ -0,0 +1,118 @@
+"""
+Fires the clan's accepted rows of submissions_export.csv at a local MongoDB as
+concurrent accepts and checks the stored template and players against what
+the rows allow. MONGO_TEST_URI points it elsewhere; skipped when no mongod answers.
+"""
+import asyncio
+import copy
+import os
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://localhost:27017")
+
+
+def _interaction(accepter_id, sent):
+    async def record(content=None, **kwargs):
+        sent.append(content)
+
+    async def ignore(*args, **kwargs):
+        pass
+
+    return SimpleNamespace(
+        user=SimpleNamespace(id=accepter_id, mention=f"<@{accepter_id}>"),
+        response=SimpleNamespace(defer=ignore),
+        followup=SimpleNamespace(send=record),
+        message=SimpleNamespace(edit=ignore),
+        channel=SimpleNamespace(send=record),
+        client=SimpleNamespace(get_user=lambda user_id: None),
+    )
+
+
+async def _accept_concurrently(submit, monkeypatch, template_doc, rows):
+    """Accepts rows in waves of parallel accepts against a throwaway database; returns what was stored and sent."""
+    from bson import ObjectId
+    from pymongo import AsyncMongoClient
+    from pymongo.errors import PyMongoError
+
+    client = AsyncMongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as e:
+        await client.close()
+        pytest.skip(f"no mongod reachable at {MONGO_TEST_URI}: {e}")
+    database = client[f"accept_concurrency_{uuid.uuid4().hex}"]
+    monkeypatch.setattr(submit, "ic_coll", database["IronClad"])
+    monkeypatch.setattr(submit, "if_coll", database["IronFoundry"])
+    monkeypatch.setattr(submit, "player_coll", database["Players"])
+    try:
+        clan = template_doc["associated_team"]
+        template_collection = submit.get_template_collection(clan)
+        await template_collection.insert_one(template_doc)
+        players = {}
+        for row in rows:
+            players.setdefault(int(row["discord_id"]), {
+                "_id": ObjectId(), "discord_id": int(row["discord_id"]), "rsn": row["rsn"],
+                "clan": clan, "total_gained": 0.0, "obtained_items": {}, "submissions": [],
+            })
+        await submit.player_coll.insert_many(list(players.values()))
+
+        sent = []
+        # No accept can see more saves than there are others in its wave, so none runs out of attempts.
+        wave_size = submit.ACCEPT_SAVE_ATTEMPTS
+        for start in range(0, len(rows), wave_size):
+            accepts = []
+            for offset, row in enumerate(rows[start:start + wave_size]):
+                view = submit.SubmissionView(int(row["discord_id"]), start + offset, clan, row["tier"], row["source"], row["item"])
+                accepts.append(submit.SubmissionView.accept_button(view, _interaction(start + offset, sent), view.children[0]))
+            await asyncio.gather(*accepts)
+
+        stored_players = await submit.player_coll.find({}).to_list(length=None)
+        return await template_collection.find_one({}), stored_players, sent
+    finally:
+        await client.drop_database(database.name)
+        await client.close()
+
+
+def test_concurrent_accepts_keep_template_and_players_consistent(submit, monkeypatch, fresh_template, accepted_submissions):
+    from bson import ObjectId
+
+    template_doc = dict(fresh_template(), _id=ObjectId())
+    scorer = object.__new__(submit.SubmissionView)
+    # A stored template carries its totals, as a previous accept saved them.
+    scorer._template_calculate_points(template_doc)
+    compiled = submit.get_compiled_template(template_doc)
+    rows = [
+        row for row in accepted_submissions
+        if row["clan"] == template_doc["associated_team"] and f"{row['tier']}.{row['source']}.{row['item']}" in compiled.items
+    ]
+
+    stored_template, stored_players, sent = asyncio.run(_accept_concurrently(submit, monkeypatch, copy.deepcopy(template_doc), rows))
+
+    assert not [message for message in sent if message and message.startswith("Error")]
+    # Each accept counts its item once, until the item reaches its threshold; the rest are rejected.
+    accepted = 0
+    for names, submitted in Counter((row["tier"], row["source"], row["item"]) for row in rows).items():
+        item_data = asyncio.run(submit._template_find_helper(stored_template, *names))["item"]
+        expected = min(submitted, int(item_data.get("required", 1)) + int(item_data.get("duplicate_required", 1)))
+        assert item_data["obtained"] == expected, names
+        accepted += expected
+    assert accepted > submit.ACCEPT_SAVE_ATTEMPTS
+    assert stored_template["version"] == template_doc["version"] + accepted
+    assert sum("accepted by" in (message or "") for message in sent) == accepted
+
+    rescored = copy.deepcopy(stored_template)
+    scorer._template_calculate_points(rescored)
+    assert rescored == stored_template
+
+    held = Counter()
+    for player_doc in stored_players:
+        items = Counter(f"{entry['tier']}.{entry['source']}.{entry['item']}" for entry in player_doc["submissions"])
+        assert player_doc["obtained_items"] == dict(items), player_doc["rsn"]
+        held.update(items)
+        total = round(asyncio.run(submit._player_calulate_from_items(player_doc, stored_template)), 2)
+        assert player_doc["total_gained"] == total, player_doc["rsn"]
+    assert sum(held.values()) == accepted
@@ -0,0 +1,98 @@
+"""
+Replays the accepted rows of submissions_export.csv through the incremental
+accept scoring and checks every step against a full _template_calculate_points.
+"""
+import asyncio
+import copy
+import time
+
+
+def _view(submit, row, clan):
+    view = object.__new__(submit.SubmissionView)
+    view.tier_name, view.source_name, view.item_name = row["tier"], row["source"], row["item"]
+    view.clan_of_submission = clan
+    return view
+
+
+def _full_score(view, template_doc):
+    scored = copy.deepcopy(template_doc)
+    return view._template_calculate_points(scored), scored
+
+
+async def _replay(submit, template_doc, rows, clear_scores_cache):
+    stats = {"scored": 0, "rejected": 0, "missing": 0, "unlocks": 0, "incremental": 0.0, "full": 0.0}
+    # A stored template carries its totals; score the starting document once like a previous accept did.
+    template_doc.update(_full_score(_view(submit, rows[0], template_doc["associated_team"]), template_doc)[1])
+
+    for row in rows:
+        view = _view(submit, row, template_doc["associated_team"])
+        item_info = await submit._template_find_helper(template_doc, view.tier_name, view.source_name, view.item_name)
+        if not item_info:
+            stats["missing"] += 1
+            continue
+        item_data = item_info["item"]
+        if await view._check_submission_rejection(item_data, int(item_data.get("obtained", 0))):
+            stats["rejected"] += 1
+            continue
+        if clear_scores_cache:
+            submit.template_scores.clear()
+
+        started = time.perf_counter()
+        full_before, _ = _full_score(view, template_doc)
+        stats["full"] += time.perf_counter() - started
+
+        # The accept path, as accept_button runs it.
+        started = time.perf_counter()
+        compiled, source_points, before = view._template_scores_before(template_doc)
+        view._update_item_obtained_count(item_data)
+        multipliers_before = copy.deepcopy(template_doc.get("multipliers", []))
+        unlocked = await submit._template_unlock_multi(template_doc, {"multipliers": multipliers_before})
+        compiled, after = view._template_rescore(template_doc, compiled, source_points, multipliers_before)
+        stats["incremental"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        full_after, fully_scored = _full_score(view, template_doc)
+        stats["full"] += time.perf_counter() - started
+
+        assert before == full_before, row
+        assert after == full_after, row
+        assert after - before == full_after - full_before, row
+        assert template_doc == fully_scored, row
+        assert compiled == submit.compile_template(template_doc), row
+
+        template_doc["version"] += 1
+        submit.cache_compiled_template(template_doc, compiled._replace(version=template_doc["version"]))
+        submit.template_scores[(str(template_doc["_id"]), template_doc["version"])] = (tuple(source_points), after)
+        stats["scored"] += 1
+        stats["unlocks"] += bool(unlocked)
+    return stats
+
+
+def _report(label, stats):
+    print(
+        f"\n{label}: {stats['scored']} scored, {stats['rejected']} rejected, {stats['missing']} not in template, "
+        f"{stats['unlocks']} with unlocks; incremental {stats['incremental'] * 1000 / max(stats['scored'], 1):.2f} ms, "
+        f"full {stats['full'] * 1000 / max(stats['scored'], 1) / 2:.2f} ms per accept"
+    )
+
+
+def test_incremental_scoring_matches_full_calculation(submit, fresh_template, accepted_submissions):
+    template_doc = dict(fresh_template(), _id="parity")
+    stats = asyncio.run(_replay(submit, template_doc, accepted_submissions, clear_scores_cache=False))
+    _report("cached scores", stats)
+    assert stats["scored"] > 0 and stats["unlocks"] > 0
+
+
+def test_incremental_scoring_matches_full_calculation_without_cached_scores(submit, fresh_template, accepted_submissions):
+    template_doc = dict(fresh_template(), _id="parity-cold")
+    stats = asyncio.run(_replay(submit, template_doc, accepted_submissions, clear_scores_cache=True))
+    _report("scores cache cleared before every accept", stats)
+    assert stats["scored"] > 0
+
+
+def test_unversioned_template_is_compiled_once(submit, fresh_template):
+    template_doc = dict(fresh_template(), _id="unversioned")
+    del template_doc["version"]
+    compiled = submit.get_compiled_template(template_doc)
+    assert compiled.version == 0
+    assert submit.get_compiled_template(copy.deepcopy(template_doc)) is compiled
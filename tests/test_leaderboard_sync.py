@@ -0,0 +1,149 @@
+"""
+Applies a Players change-stream event to the synced Mongo boards and checks that
+the next refresh of the Mongo source records it to history and the snapshot, and
+that history follows a player across a change of rsn letter case.
+"""
+import asyncio
+import gzip
+import json
+
+import pytest
+
+
+class _Stream:
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.alive = True
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def try_next(self):
+        if self.changes:
+            self.resume_token = {"_data": str(len(self.changes))}
+            return self.changes.pop(0)
+        self.alive = False
+        return None
+
+
+class _Players:
+    """Serves a Players scan and one change stream; reopening the stream ends the watcher."""
+
+    def __init__(self, docs, changes):
+        self.docs = docs
+        self.changes = changes
+        self.opened = False
+
+    def find(self, filter=None, projection=None, batch_size=None):
+        return self._scan()
+
+    async def _scan(self):
+        for doc in self.docs:
+            yield dict(doc)
+
+    async def watch(self, pipeline, **kwargs):
+        if self.opened:
+            raise asyncio.CancelledError
+        self.opened = True
+        return _Stream(self.changes)
+
+
+class _History:
+    def __init__(self):
+        self.inserted = []
+        self.written = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.inserted.extend(docs)
+
+    async def bulk_write(self, ops, ordered=True):
+        self.written.extend(ops)
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+
+def _snapshot_board(path, title):
+    with open(path, "rb") as f:
+        snapshot = json.loads(gzip.decompress(f.read()))
+    board = next(board for board in snapshot["sources"]["mongo"]["boards"] if board["title"] == title)
+    return dict(zip(board["rsn"], board["value"]))
+
+
+def test_change_stream_update_is_recorded_to_history_and_snapshot(backend, monkeypatch, tmp_path):
+    from cachetools import LRUCache
+
+    players = [
+        {"_id": 1, "rsn": "alice", "clan": "ironclad", "total_gained": 10.0, "obtained_items": {}},
+        {"_id": 2, "rsn": "bob", "clan": "ironfoundry", "total_gained": 20.0, "obtained_items": {}},
+    ]
+    change = {"operationType": "update", "documentKey": {"_id": 1}, "fullDocument": dict(players[0], total_gained=30.0)}
+    snapshots, series = _History(), _History()
+    snapshot_path = str(tmp_path / "leaderboard_snapshot.json.gz")
+
+    monkeypatch.setattr(backend, "MONGO_LEADERBOARD_SYNC", "changestream")
+    monkeypatch.setattr(backend, "LEADERBOARD_HISTORY", "on")
+    monkeypatch.setattr(backend, "LEADERBOARD_SNAPSHOT_PATH", snapshot_path)
+    monkeypatch.setattr(backend, "players_coll_async", _Players(players, [change]))
+    monkeypatch.setattr(backend, "history_snapshots_coll_async", snapshots)
+    monkeypatch.setattr(backend, "history_series_coll_async", series)
+    monkeypatch.setattr(backend, "history_last_rows", {})
+    monkeypatch.setattr(backend, "history_last_clans", {})
+    monkeypatch.setattr(backend, "history_snapshot_counts", {})
+    monkeypatch.setattr(backend, "mongo_sorted_boards", None)
+    monkeypatch.setattr(backend, "leaderboards_cache", LRUCache(maxsize=16))
+    monkeypatch.setitem(backend.leaderboard_sources, "mongo", backend._new_leaderboard_source(
+        "mongo", backend._refresh_mongo_source, backend.MONGO_REFRESH_SECONDS
+    ))
+    mongo_source = backend.leaderboard_sources["mongo"]
+    title = "Total Gained (Points)"
+    board = backend._board_slug(title)
+
+    async def run():
+        # The boards as a previous stream left them, recorded by a periodic refresh.
+        await backend._get_mongo_leaderboards_data_helper()
+        await backend._refresh_leaderboard_sources([mongo_source])
+        assert [snapshot["keyframe"] for snapshot in snapshots.inserted if snapshot["board"] == board] == [True]
+        assert _snapshot_board(snapshot_path, title) == {"alice": 10.0, "bob": 20.0}
+
+        with pytest.raises(asyncio.CancelledError):
+            await backend._watch_players_change_stream()
+        assert mongo_source["changed"]
+
+        await backend._refresh_leaderboard_sources([mongo_source])
+
+    asyncio.run(run())
+
+    recorded = [snapshot for snapshot in snapshots.inserted if snapshot["board"] == board]
+    assert len(recorded) == 2 and not recorded[1]["keyframe"]
+    assert dict(zip(recorded[1]["rsns"], recorded[1]["values"])) == {"alice": 30.0, "bob": 20.0}
+    assert _snapshot_board(snapshot_path, title) == {"alice": 30.0, "bob": 20.0}
+    assert not mongo_source["changed"]
+
+
+def test_history_series_follow_the_normalized_rsn(backend, monkeypatch):
+    snapshots, series = _History(), _History()
+    monkeypatch.setattr(backend, "history_snapshots_coll_async", snapshots)
+    monkeypatch.setattr(backend, "history_series_coll_async", series)
+    monkeypatch.setattr(backend, "history_last_rows", {})
+    monkeypatch.setattr(backend, "history_last_clans", {})
+    monkeypatch.setattr(backend, "history_snapshot_counts", {})
+    monkeypatch.setattr(backend, "history_indexes_ready", True)
+
+    def board(rsn, value):
+        return {"title": "Total Gained (Points)", "metric_page": None, "rsn": [rsn, "bob"], "value": [value, 5.0], "clan": [1, 2]}
+
+    async def run():
+        await backend._record_leaderboard_history([board("Big_Alice", 10.0)])
+        await backend._record_leaderboard_history([board("big alice", 10.0)])
+        await backend._record_leaderboard_history([board("BIG ALICE", 12.0)])
+
+    asyncio.run(run())
+
+    assert len(snapshots.inserted) == 2
+    player_keys = [op._filter["key"] for op in series.written if op._filter["series"] == "player"]
+    assert player_keys == ["big alice", "bob", "big alice"]
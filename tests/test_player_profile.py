@@ -0,0 +1,44 @@
+"""
+Looks a player up through /players/{rsn} from the in-memory indexes and checks
+the points breakdown against the bot's own total_gained calculation.
+"""
+import asyncio
+from collections import Counter
+
+import pytest
+
+
+def test_profile_points_match_the_bots_scoring(backend, submit, monkeypatch, fresh_template, accepted_submissions):
+    from cachetools import LRUCache
+
+    template_doc = fresh_template()
+    clan = template_doc["associated_team"]
+    for multiplier in template_doc["multipliers"][::2]:
+        multiplier["unlocked"] = True
+    rows = [row for row in accepted_submissions if row["clan"] == clan]
+    rsn = Counter(row["rsn"] for row in rows).most_common(1)[0][0]
+    obtained_items = dict(Counter(f"{row['tier']}.{row['source']}.{row['item']}" for row in rows if row["rsn"] == rsn))
+    player_doc = {"_id": "player", "rsn": rsn, "clan": clan, "total_gained": 1.0, "obtained_items": obtained_items}
+
+    monkeypatch.setattr(backend, "leaderboards_cache", LRUCache(maxsize=16))
+    monkeypatch.setattr(backend, "mongo_player_profiles", {})
+    monkeypatch.setattr(backend, "mongo_profile_keys", {})
+    monkeypatch.setattr(backend, "mongo_player_profiles_complete", True)
+    monkeypatch.setitem(backend.template_cache, clan, {
+        "version": template_doc["version"], "docs": [template_doc], "checked_at": float("inf"), "loaded_at": float("inf"),
+    })
+    backend._set_leaderboards_cache([{
+        "title": "Total Gained (Points)", "metric_page": None,
+        "rsn": ["someone", rsn], "value": [2.0, 1.0], "clan": [0, backend.CLAN_INDEXES[clan]],
+    }])
+    backend._set_player_profile("player", player_doc)
+
+    profile = asyncio.run(backend.get_player_profile(rsn.upper().replace(" ", "_")))
+
+    expected = asyncio.run(submit._player_calulate_from_items(player_doc, template_doc))
+    assert profile["rsn"] == rsn and profile["clan"] == clan
+    assert profile["boards"][0]["rank"] == 2
+    assert profile["points"]["total"] == round(expected, 2)
+    assert sum(source["points"] for source in profile["points"]["sources"]) == pytest.approx(expected, abs=0.01 * len(profile["points"]["sources"]))
+    assert sum(item["count"] for source in profile["points"]["sources"] for item in source["items"]) == sum(obtained_items.values())
+    assert any(source["factor"] != 1.0 for source in profile["points"]["sources"])